@@ -1,18 +1,45 @@
+import os
+import time
+import uuid
+from datetime import date
 import streamlit as st
 import db
 import data_fetcher
 import constants
-from treasury import add_treasury, remove_treasury, calculate_current_value
-from constants import TREASURIES
+import quote_cache
+import valuation
+import dashboard
+import history
+import profiling
+import read_cache
+import importer
+import refresher
+import store
+from treasury import add_treasury, remove_treasury, current_values
+import retirement
+import risk
+import cashflows
+import tax_lots
+import live_valuation
+import price_history
 from retirement import add_retirement, remove_retirement
 from constants import RETIREMENT_ACCOUNTS
 
-# Initialize database and load portfolio
-db.init_db()
+# Profile this render when enabled by FINANCE_PROFILE=1 or the sidebar debug toggle
+profiling.set_enabled(profiling.ENV_ENABLED or st.session_state.get("show_profiling", False))
+profiling.start_render()
+
+# Each session works on one portfolio database, picked with ?portfolio=<name>
+# (the default database without it); one process serves them all
+try:
+    db.select_database(db.database_path(st.query_params.get("portfolio")))
+except ValueError as e:
+    st.error(str(e))
+    st.stop()
 
-# Sync treasuries from DB on startup
-from treasury import sync_treasuries_from_db
-sync_treasuries_from_db()
+# Initialize database; its in-memory state is shared by every session using it
+db.init_db()
+portfolio_store = store.get_store()
 
 # Ensure cash account session state is always initialized and loaded from DB
 cash_types = ["SWVXX", "SPAXX", "Checking"]
@@ -21,79 +48,91 @@ cash_types = ["SWVXX", "SPAXX", "Checking"]
 # ---------------- Sidebar Navigation ----------------
 st.sidebar.title("Navigation")
 page = st.sidebar.radio("Go to", ["Dashboard", "Manage Portfolio", "Treasuries", "Retirement Accounts"])
+st.sidebar.checkbox("Show profiling panel", key="show_profiling")
 
 
 # ---------------- Helper: Price Update ----------------
 # Initialize session state flags
-if "prices_updated" not in st.session_state:
-    st.session_state.prices_updated = False
 
-def maybe_update_prices():
-    # Update prices only if they haven't been updated this session. 
-    if not st.session_state.prices_updated:
-        data_fetcher.update_all_stock_prices()
-        st.session_state.prices_updated = True
+def maybe_update_prices(snapshot=None):
+    # Render from cached quotes right away; the shared background refresher
+    # fetches expired ones. Returns the symbols whose displayed price is stale.
+    refresher.start()
+    quote_cache.load_cached_prices()
+    symbols = snapshot.symbols() if snapshot is not None else data_fetcher.get_tracked_symbols()
+    stale = set(quote_cache.get_stale_symbols(symbols))
+    if stale:
+        refresher.watch(stale)
+    return stale
+
+@read_cache.cached()
+def render_breakdown_chart(labels: tuple, values: tuple) -> bytes:
+    # Net worth pie chart as PNG, cached on its inputs so unrelated reruns skip matplotlib
+    import io
+    import matplotlib
+    matplotlib.use("Agg")  # rendered server-side; no GUI backend needed
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    ax.pie(values, labels=labels, autopct='%1.1f%%', startangle=90, counterclock=False)
+    ax.axis('equal')
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
+@st.fragment(run_every=1.0)
+def render_live_totals(tracker, holder):
+    # Re-rendered every second on its own; renews this session's hold on the
+    # live feed and reads the streaming totals, which the feed moves tick by
+    # tick without revaluing the portfolio
+    live_valuation.start_feed(holder=holder)
+    totals = tracker.totals()
+    status = live_valuation.feed_status()
+    live_cols = st.columns(3)
+    live_cols[0].metric("Live Net Worth", f"${totals.net_worth:,.2f}")
+    live_cols[1].metric("Live Portfolio", f"${totals.by_category['Portfolio']:,.2f}")
+    live_cols[2].metric("Live IRA Equities", f"${totals.by_category['IRA Equities']:,.2f}")
+    rate = status.ticks / max(time.time() - status.started, 1e-9) if status.started else 0.0
+    st.caption(f"Feed: {status.source or 'stopped'} · {status.ticks:,} ticks ({rate:,.0f}/s)"
+               + (f" · last tick {time.strftime('%H:%M:%S', time.localtime(totals.as_of))}" if totals.as_of else "")
+               + (f" · error: {status.last_error}" if status.last_error else ""))
 
 # ---------------- Dashboard Page ----------------
 if page == "Dashboard":
-    # Always load latest cash balances from DB (needed for pie chart and dashboard)
-    db_cash = db.get_cash_accounts()
-
+    # One consistent read of every account, shared by all dashboard sections
+    with profiling.timer("dashboard.snapshot"):
+        snapshot = db.get_portfolio_snapshot()
 
     st.title("📊 My Financial Dashboard")
 
     # Manual refresh button
     if st.button("Refresh Prices"):
-        st.session_state.prices_updated = False  # force update next render
-        # Sync cash values from session state to constants.CASH_ACCOUNTS
-        cash_types = ["SWVXX", "SPAXX", "Checking"]
-        for cash_type in cash_types:
-            key = f"cash_{cash_type}"
-            if key in st.session_state:
-                constants.CASH_ACCOUNTS[cash_type] = st.session_state[key]
-        maybe_update_prices()
-
-    maybe_update_prices()
-
-    # Always load latest cash balances from DB
-    db_cash = db.get_cash_accounts()
-    for cash_type in cash_types:
-        constants.CASH_ACCOUNTS[cash_type] = db_cash.get(cash_type, 0.0)
-        st.session_state[f"cash_{cash_type}"] = db_cash.get(cash_type, 0.0)
-    cash_total = sum(db_cash.get(c, 0.0) for c in cash_types)
-    net_worth = data_fetcher.get_net_worth()
-
-    # Portfolio summary
-    portfolio_metrics = []
-    if not constants.PORTFOLIO:
-        portfolio_metrics.append(("No stocks in your portfolio yet.", "", ""))
-    else:
-        for symbol, shares in constants.PORTFOLIO.items():
-            price = constants.STOCK_PRICES.get(symbol, 0.0)
-            portfolio_metrics.append((f"{symbol} ({shares} shares)", f"${price:.2f}", f"Value: ${price * shares:.2f}"))
-
-    # IRA summary
-    accounts = db.get_retirement_accounts()
-    ira_holdings = []
-    for acc_id, name, acc_type, balance in accounts:
-        if "IRA" in acc_type:
-            holdings = db.get_ira_holdings(acc_id)
-            for _, symbol, shares in holdings:
-                ira_holdings.append((name, acc_type, symbol, shares))
-    ira_metrics = []
-    if not ira_holdings:
-        ira_metrics.append(("No IRA equities yet.", "", ""))
-    else:
-        for ira_name, ira_type, symbol, shares in ira_holdings:
-            price = constants.STOCK_PRICES.get(symbol.upper(), 0.0)
-            ira_metrics.append((f"{ira_name} ({ira_type}) - {symbol} ({shares} shares)", f"${price:.2f}", f"Value: ${price * shares:.2f}"))
-
-    # Cash summary
-    cash_metrics = []
-    for cash_type in cash_types:
-        key = f"cash_{cash_type}"
-        balance = st.session_state.get(key, 0.0)
-        cash_metrics.append((f"{cash_type} Balance", f"${balance:,.2f}", ""))
+        # The refresher does the fetch; wait for it up to the refresh budget
+        refresher.start()
+        if refresher.request_refresh(force=True, timeout=data_fetcher.TOTAL_BUDGET):
+            st.session_state.record_history = True
+
+    with profiling.timer("dashboard.prices"):
+        stale_symbols = maybe_update_prices(snapshot)
+    if stale_symbols:
+        st.caption(f"Showing cached prices; refreshing {len(stale_symbols)} stale quote(s) in the background.")
+
+    # Everything below reads from one context, computed once per render
+    # (and reused across reruns until the data or prices change)
+    with profiling.timer("dashboard.context"):
+        ctx = dashboard.build_context(frozenset(stale_symbols))
+
+    # Keep the session cash balances in step with the DB
+    for cash_type, balance in ctx.cash_balances:
+        st.session_state[f"cash_{cash_type}"] = balance
+
+    # Record category totals for the history chart (on refresh, else at most every
+    # history.MIN_SNAPSHOT_INTERVAL), but never from stale prices
+    if not stale_symbols:
+        if st.session_state.pop("record_history", False):
+            history.record_snapshot(ctx.valuation.by_category)
+        else:
+            history.maybe_record_snapshot(ctx.valuation.by_category)
 
     # Make the entire dashboard page (title, buttons, cards) wide
     st.markdown("""
@@ -109,112 +148,108 @@ if page == "Dashboard":
     cols = st.columns(4, gap="large")
     cols = st.columns(5, gap="large")
     # Net Worth Card
-    with cols[0]:
+    with cols[0], profiling.timer("dashboard.net_worth_card"):
         st.markdown('<div class="dashboard-card">', unsafe_allow_html=True)
         st.markdown("#### Net Worth")
-        st.metric(label="Total Net Worth (including cash)", value=f"${net_worth + cash_total:,.2f}")
-        # Show Roth 401k and Traditional 401k balances if present
-        roth_401k_balance = None
-        trad_401k_balance = None
-        accounts = db.get_retirement_accounts()
-        for acc_id, name, acc_type, balance in accounts:
-            if acc_type == "401k_roth":
-                roth_401k_balance = balance
-            elif acc_type == "401k_traditional":
-                trad_401k_balance = balance
+        st.metric(label="Total Net Worth (including cash)", value=f"${ctx.net_worth:,.2f}")
     # Portfolio Card
-    with cols[1]:
+    with cols[1], profiling.timer("dashboard.portfolio_card"):
         st.markdown('<div class="dashboard-card">', unsafe_allow_html=True)
         st.markdown("#### Portfolio")
-        for label, value, delta in portfolio_metrics:
+        for label, value, delta in ctx.portfolio_metrics:
             st.metric(label=label, value=value, delta=delta)
         st.markdown('</div>', unsafe_allow_html=True)
     # IRA Card
-    with cols[2]:
+    with cols[2], profiling.timer("dashboard.ira_card"):
         st.markdown('<div class="dashboard-card">', unsafe_allow_html=True)
         st.markdown("#### IRA Account Equities")
-        for label, value, delta in ira_metrics:
+        for label, value, delta in ctx.ira_metrics:
             st.metric(label=label, value=value, delta=delta)
         st.markdown('</div>', unsafe_allow_html=True)
-        if roth_401k_balance is not None:
-            st.metric(label="Roth 401k Balance", value=f"${roth_401k_balance:,.2f}")
-        if trad_401k_balance is not None:
-            st.metric(label="Traditional 401k Balance", value=f"${trad_401k_balance:,.2f}")
+        # Show Roth 401k and Traditional 401k balances if present
+        for label, balance in ctx.retirement_balances:
+            st.metric(label=label, value=f"${balance:,.2f}")
         st.markdown('</div>', unsafe_allow_html=True)
     # Cash Accounts Card
     # Treasuries Card (by type)
-    with cols[3]:
+    with cols[3], profiling.timer("dashboard.treasuries_card"):
         st.markdown('<div class="dashboard-card">', unsafe_allow_html=True)
         st.markdown("#### Treasuries (by Type)")
-        # Aggregate by type
-        type_totals = {}
-        for name, data in TREASURIES.items():
-            ttype = data.get("type", "Other")
-            value = calculate_current_value(name)
-            type_totals[ttype] = type_totals.get(ttype, 0.0) + value
-        if not type_totals:
+        if not ctx.treasury_totals:
             st.metric(label="No treasuries", value="$")
         else:
-            for ttype, total in type_totals.items():
+            for ttype, total in ctx.treasury_totals:
                 st.metric(label=ttype, value=f"${total:,.2f}")
         st.markdown('</div>', unsafe_allow_html=True)
 
     # Cash Accounts Card
-    with cols[4]:
+    with cols[4], profiling.timer("dashboard.cash_card"):
         st.markdown('<div class="dashboard-card">', unsafe_allow_html=True)
         st.markdown("#### Cash Accounts")
-        for label, value, _ in cash_metrics:
-            st.metric(label=label, value=value)
+        for cash_type, balance in ctx.cash_balances:
+            st.metric(label=f"{cash_type} Balance", value=f"${balance:,.2f}")
         st.markdown('</div>', unsafe_allow_html=True)
 
     # --- Net Worth Breakdown Pie Chart (bottom left, below Net Worth) ---
-    with cols[0]:
-        # Calculate category values
-        import matplotlib.pyplot as plt
-        portfolio_value = sum(constants.STOCK_PRICES.get(symbol, 0.0) * shares for symbol, shares in constants.PORTFOLIO.items())
-        ira_value = 0.0
-        roth_401k_value = 0.0
-        trad_401k_value = 0.0
-        treasury_value = sum(calculate_current_value(name) for name in TREASURIES)
-        cash_value = sum(db_cash.get(c, 0.0) for c in cash_types)
-        accounts = db.get_retirement_accounts()
-        for acc_id, name, acc_type, balance in accounts:
-            if "IRA" in acc_type:
-                holdings = db.get_ira_holdings(acc_id)
-                for _, symbol, shares in holdings:
-                    price = constants.STOCK_PRICES.get(symbol.upper(), 0.0)
-                    ira_value += price * shares
-            elif acc_type == "401k_roth":
-                roth_401k_value += balance
-            elif acc_type == "401k_traditional":
-                trad_401k_value += balance
-
-        labels = []
-        values = []
-        if portfolio_value > 0:
-            labels.append("Portfolio")
-            values.append(portfolio_value)
-        if ira_value > 0:
-            labels.append("IRA Equities")
-            values.append(ira_value)
-        if roth_401k_value > 0:
-            labels.append("Roth 401k")
-            values.append(roth_401k_value)
-        if trad_401k_value > 0:
-            labels.append("Traditional 401k")
-            values.append(trad_401k_value)
-        if cash_value > 0:
-            labels.append("Cash Accounts")
-            values.append(cash_value)
-        if treasury_value > 0:
-            labels.append("Treasuries")
-            values.append(treasury_value)
-        if values:
-            fig, ax = plt.subplots()
-            ax.pie(values, labels=labels, autopct='%1.1f%%', startangle=90, counterclock=False)
-            ax.axis('equal')
+    with cols[0], profiling.timer("dashboard.breakdown_chart"):
+        if ctx.breakdown:
+            labels, pie_values = zip(*ctx.breakdown)
             st.markdown("#### Net Worth Breakdown")
-            st.pyplot(fig)
+            st.image(render_breakdown_chart(labels, pie_values))
+
+    # --- Live totals from the streaming price feed (see live_valuation.py) ---
+    # Each session holds the shared feed while its box is ticked; unticking
+    # (or closing the tab, after live_valuation.FEED_LEASE) lets it stop
+    live_feed_holder = st.session_state.setdefault("live_feed_holder", uuid.uuid4().hex)
+    if st.checkbox("Stream live totals", key="live_totals",
+                   help="Update net worth tick by tick from the live price feed (mock market in mock mode)"):
+        render_live_totals(live_valuation.get_tracker(), live_feed_holder)
+    else:
+        live_valuation.release_feed(live_feed_holder)
+
+    # --- Net Worth History (full width, below the cards) ---
+    st.markdown("#### Net Worth History")
+    history_ranges = {"1 Week": 7, "1 Month": 30, "6 Months": 182, "1 Year": 365, "5 Years": 5 * 365, "All": None}
+    range_label = st.selectbox("Range", list(history_ranges), index=1, key="history_range")
+    range_days = history_ranges[range_label]
+    # get_history picks the coarsest resolution that still suits the range
+    with profiling.timer("dashboard.history_chart"):
+        net_worth_history = history.get_history(time.time() - range_days * 86400 if range_days else None)
+        if net_worth_history:
+            import pandas as pd
+            st.area_chart(pd.DataFrame.from_dict(net_worth_history, orient="index").fillna(0.0))
+        else:
+            st.info("No net worth history recorded yet.")
+
+    # --- Risk (taxable and IRA equities, from the local price history) ---
+    st.markdown("#### Risk")
+    risk_cols = st.columns(2)
+    window_label = risk_cols[0].selectbox("Window", list(risk.WINDOWS), index=2, key="risk_window")
+    confidence = risk_cols[1].selectbox("VaR confidence", [0.95, 0.99], format_func=lambda c: f"{c:.0%}", key="risk_confidence")
+    with profiling.timer("dashboard.risk"):
+        risk_shares = risk.holdings(snapshot)
+        report = risk.risk_report(risk_shares, risk.WINDOWS[window_label], confidence) if risk_shares else None
+    if report is None:
+        st.info("No equities to analyze yet.")
+    else:
+        if report.missing:
+            st.caption(f"No price history for: {', '.join(report.missing)}")
+            if st.button("Download price history"):
+                with st.spinner("Fetching daily history..."):
+                    price_history.ingest(report.missing)
+                st.rerun()
+        if report.days >= 2:
+            st.caption(f"{report.days} trading days, {report.start} to {report.end}, positions at the last close (${report.value:,.2f})")
+            metric_cols = st.columns(4)
+            metric_cols[0].metric("Volatility (annualized)", f"{report.volatility:.1%}")
+            metric_cols[1].metric(f"1-day VaR, historical ({report.confidence:.0%})", f"${report.var_historical:,.2f}")
+            metric_cols[2].metric(f"1-day VaR, parametric ({report.confidence:.0%})", f"${report.var_parametric:,.2f}")
+            metric_cols[3].metric("Max drawdown", f"{report.max_drawdown:.1%}")
+            import pandas as pd
+            with st.expander("Per-symbol volatility and correlation"):
+                st.dataframe(pd.DataFrame({"Exposure": report.exposure, "Volatility": report.symbol_volatility},
+                                          index=list(report.symbols)).style.format({"Exposure": "${:,.2f}", "Volatility": "{:.1%}"}))
+                st.dataframe(pd.DataFrame(report.correlation, index=list(report.symbols), columns=list(report.symbols)).round(2))
 
 # ---------------- Manage Portfolio Page ----------------
 elif page == "Manage Portfolio":
@@ -228,14 +263,37 @@ elif page == "Manage Portfolio":
         if submitted and symbol_input and shares_input > 0:
             db.add_stock(symbol_input.strip().upper(), shares_input)
             st.success(f"{shares_input} shares of {symbol_input.upper()} added!")
-            # Reset session flag so dashboard updates prices
-            st.session_state.prices_updated = False
+            # Fetch a price for a new symbol without waiting for the next interval
+            refresher.watch([symbol_input.strip().upper()])
+
+    st.subheader("Import Positions")
+    with st.form("import_positions_form"):
+        uploaded = st.file_uploader("Brokerage export (CSV or OFX)", type=["csv", "ofx", "qfx"])
+        ira_names = [name for _, name, acc_type, _ in db.get_retirement_accounts() if "IRA" in acc_type]
+        import_account = st.selectbox("Default account", ["Taxable"] + ira_names,
+                                      help="Used for rows without an account column (and for OFX files)")
+        import_mode = st.radio("Mode", ["replace", "add"], horizontal=True,
+                               help="replace sets positions to the file's quantities; add adds them to current holdings")
+        if st.form_submit_button("Import") and uploaded is not None:
+            try:
+                result = importer.import_file(uploaded, uploaded.name, import_account, import_mode)
+            except ValueError as e:
+                st.error(f"Import failed: {e}")
+            else:
+                st.success(f"Imported {result.rows_read} rows: {result.stocks} stocks, "
+                           f"{result.ira_holdings} IRA holdings, {result.cash_accounts} cash balances.")
+                for line, message in result.errors:
+                    st.warning(f"Line {line}: {message}" if line else message)
+                # Drop edited values so the widgets below show the imported ones
+                for key in [k for k in st.session_state if k.startswith(("edit_shares_", "portfolio_cash_"))]:
+                    del st.session_state[key]
 
     st.subheader("Current Portfolio")
-    if not constants.PORTFOLIO:
+    stocks = portfolio_store.state.stocks
+    if not stocks:
         st.info("No stocks yet.")
     else:
-        for symbol, shares in list(constants.PORTFOLIO.items()):
+        for symbol, shares in stocks.items():
             col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
             col1.write(symbol)
             # Editable number input for shares
@@ -247,30 +305,112 @@ elif page == "Manage Portfolio":
             removed = col4.button("Remove", key=f"remove_{symbol}")
             if updated and new_shares != shares:
                 db.update_stock_shares(symbol, new_shares)
-                st.session_state.prices_updated = False
                 st.success(f"Updated {symbol} to {new_shares} shares.")
                 st.rerun()
             if removed:
                 db.remove_stock(symbol)
-                st.session_state.prices_updated = False
                 st.rerun()
 
+    # --- Tax Lots: purchases and sales with cost basis, for taxable and IRA accounts ---
+    st.subheader("Tax Lots")
+    lot_accounts = {"Taxable": tax_lots.TAXABLE}
+    lot_accounts.update({name: acc_id for acc_id, name, acc_type, _ in db.get_retirement_accounts() if "IRA" in acc_type})
+    lot_account_names = {acc_id: name for name, acc_id in lot_accounts.items()}
+    buy_col, sell_col = st.columns(2)
+    with buy_col, st.form("buy_lot_form"):
+        st.markdown("##### Record Purchase")
+        buy_account = st.selectbox("Account", list(lot_accounts), key="buy_lot_account")
+        buy_symbol = st.text_input("Symbol", key="buy_lot_symbol")
+        buy_quantity = st.number_input("Shares", min_value=0.0, step=1.0, key="buy_lot_quantity")
+        buy_cost = st.number_input("Cost per share ($)", min_value=0.0, step=0.01, key="buy_lot_cost")
+        buy_date = st.date_input("Acquired", key="buy_lot_date")
+        if st.form_submit_button("Record Purchase"):
+            try:
+                tax_lots.buy(lot_accounts[buy_account], buy_symbol, buy_quantity, buy_cost, buy_date.isoformat())
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.success(f"Recorded {buy_quantity:g} {buy_symbol.strip().upper()} in {buy_account}.")
+                refresher.watch([buy_symbol.strip().upper()])
+    with sell_col, st.form("sell_lot_form"):
+        st.markdown("##### Record Sale")
+        sell_account = st.selectbox("Account", list(lot_accounts), key="sell_lot_account")
+        sell_symbol = st.text_input("Symbol", key="sell_lot_symbol")
+        sell_quantity = st.number_input("Shares", min_value=0.0, step=1.0, key="sell_lot_quantity")
+        sell_price = st.number_input("Price per share ($)", min_value=0.0, step=0.01, key="sell_lot_price")
+        sell_method = st.selectbox("Lots", tax_lots.METHODS, key="sell_lot_method")
+        sell_lot_ids = st.text_input("Lot IDs (Specific ID, comma separated)", key="sell_lot_ids")
+        if st.form_submit_button("Record Sale"):
+            try:
+                lot_ids = [int(part) for part in sell_lot_ids.split(",") if part.strip()]
+                disposals = tax_lots.sell(lot_accounts[sell_account], sell_symbol, sell_quantity, sell_price,
+                                          sell_method, lot_ids)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.success(f"Sold {sell_quantity:g} {sell_symbol.strip().upper()} from {len(disposals)} lot(s); "
+                           f"realized ${sum(d.gain for d in disposals):,.2f}.")
+
+    mismatches = tax_lots.lot_mismatches()
+    if mismatches:
+        st.warning("Lots hold more shares than the account: " + ", ".join(
+            f"{symbol} in {lot_account_names.get(acc_id, f'#{acc_id}')} ({lot_shares:g} in lots, {held:g} held)"
+            for acc_id, symbol, lot_shares, held in mismatches))
+        if st.button("Close excess lots", key="close_excess_lots"):
+            tax_lots.close_excess_lots()
+            st.rerun()
+
+    with profiling.timer("manage.tax_lots"):
+        gains = tax_lots.unrealized_gains()
+    if not len(gains.positions.symbols):
+        st.info("No tax lots recorded yet.")
+    else:
+        import pandas as pd
+        positions = gains.positions
+        st.dataframe(pd.DataFrame({
+            "Account": [lot_account_names.get(acc_id, f"#{acc_id}") for acc_id in positions.account_ids],
+            "Symbol": positions.symbols,
+            "Lots": positions.lots,
+            "Shares": positions.quantity,
+            "Cost basis": positions.cost,
+            "Value": gains.value,
+            "Unrealized gain": gains.gain,
+        }).style.format({"Cost basis": "${:,.2f}", "Value": "${:,.2f}", "Unrealized gain": "${:,.2f}"}, na_rep="-"),
+            hide_index=True)
+        held_for = tax_lots.holding_period_gains()
+        realized = tax_lots.realized_gains(date.today().year)
+        gain_cols = st.columns(4)
+        gain_cols[0].metric("Unrealized, short-term", f"${held_for['short_term']:,.2f}")
+        gain_cols[1].metric("Unrealized, long-term", f"${held_for['long_term']:,.2f}")
+        gain_cols[2].metric(f"Realized {date.today().year}, short-term", f"${realized['short_term']:,.2f}")
+        gain_cols[3].metric(f"Realized {date.today().year}, long-term", f"${realized['long_term']:,.2f}")
+        with st.expander("Open lots"):
+            book = tax_lots.get_lot_book()
+            st.dataframe(pd.DataFrame({
+                "Lot ID": book.ids,
+                "Account": [lot_account_names.get(acc_id, f"#{acc_id}") for acc_id in book.account_ids],
+                "Symbol": book.symbols,
+                "Acquired": book.acquired.astype(str),
+                "Shares": book.quantity,
+                "Cost per share": book.unit_cost,
+            }), hide_index=True)
+
     # --- Cash Balances Section ---
     st.subheader("Cash Balances")
     cash_types = ["SWVXX", "SPAXX", "Checking"]
+    cash_balances = portfolio_store.state.cash
     cash_changed = False
     for cash_type in cash_types:
         key = f"portfolio_cash_{cash_type}"
         if key not in st.session_state:
-            st.session_state[key] = constants.CASH_ACCOUNTS.get(cash_type, 0.0)
+            st.session_state[key] = cash_balances.get(cash_type, 0.0)
         new_val = st.number_input(f"{cash_type} Balance ($)", min_value=0.0, value=st.session_state[key], step=100.0, key=key)
-        if new_val != constants.CASH_ACCOUNTS.get(cash_type, 0.0):
+        if new_val != cash_balances.get(cash_type, 0.0):
             cash_changed = True
     if st.button("Save Cash Balances"):
         for cash_type in cash_types:
             key = f"portfolio_cash_{cash_type}"
             val = st.session_state[key]
-            constants.CASH_ACCOUNTS[cash_type] = val
             db.set_cash_account(cash_type, val)
             # Also update the dashboard session state key
             dash_key = f"cash_{cash_type}"
@@ -300,20 +440,44 @@ elif page == "Treasuries":
                 purchase_date.isoformat(),
                 maturity_date.isoformat()
             )
-            sync_treasuries_from_db()
             st.success(f"Treasury '{name}' added!")
 
     st.subheader("Current Treasuries")
-    sync_treasuries_from_db()
-    if not TREASURIES:
+    treasuries = portfolio_store.state.treasuries
+    if not treasuries:
         st.info("No treasuries added yet.")
     else:
-        for name, data in TREASURIES.items():
-            value = calculate_current_value(name)
+        treasury_values = current_values()
+        for name, data in treasuries.items():
+            value = treasury_values[name]
             st.metric(label=name, value=f"${value:,.2f}", delta=f"Face: ${data['face_value']}")
             if st.button("Remove", key=name):
                 remove_treasury(name)
-                sync_treasuries_from_db()
+
+        # --- Cash-flow ladder: coupons and maturities per month from now on ---
+        st.subheader("Cash-Flow Ladder")
+        ladder_horizons = {"1 Year": 12, "5 Years": 60, "10 Years": 120, "All": None}
+        horizon = st.selectbox("Horizon", list(ladder_horizons), index=1, key="ladder_horizon")
+        with profiling.timer("treasuries.ladder"):
+            ladder = cashflows.monthly_ladder(ladder_horizons[horizon])
+        if not len(ladder.months):
+            st.info("No upcoming coupon or principal payments.")
+        else:
+            import pandas as pd
+            st.bar_chart(pd.DataFrame({"Interest": ladder.interest, "Principal": ladder.principal},
+                                      index=ladder.months.astype(str)))
+            st.caption(f"${ladder.interest.sum():,.2f} interest and ${ladder.principal.sum():,.2f} principal over {len(ladder.months)} months")
+            min_gap = st.number_input("Flag stretches without a maturity of at least (months)", min_value=1, max_value=120, value=3, key="ladder_min_gap")
+            gaps = cashflows.reinvestment_gaps(ladder, int(min_gap))
+            if gaps:
+                st.markdown("##### Reinvestment Gaps")
+                st.dataframe(pd.DataFrame([
+                    {"From": str(gap.start), "To": str(gap.end), "Months": gap.months,
+                     "Idle cash": f"${gap.idle_cash:,.2f}", "Interest in gap": f"${gap.interest:,.2f}"}
+                    for gap in gaps
+                ]), hide_index=True)
+            else:
+                st.caption("No gaps in the ladder.")
 elif page == "Retirement Accounts":
     st.title("🏦 Retirement Accounts")
 
@@ -329,7 +493,8 @@ elif page == "Retirement Accounts":
             st.rerun()
 
     st.subheader("Your Retirement Accounts")
-    accounts = db.get_retirement_accounts()
+    snapshot = db.get_portfolio_snapshot()
+    accounts = snapshot.retirement_accounts
     if not accounts:
         st.info("No retirement accounts yet.")
     else:
@@ -351,7 +516,7 @@ elif page == "Retirement Accounts":
                 # IRA equities management
                 if "IRA" in acc_type:
                     st.markdown("**IRA Holdings**")
-                    holdings = db.get_ira_holdings(acc_id)
+                    holdings = snapshot.ira_holdings.get(acc_id, [])
                     ira_total = 0.0
                     for holding_id, symbol, shares in holdings:
                         price = constants.STOCK_PRICES.get(symbol.upper(), 0.0)
@@ -402,3 +567,59 @@ elif page == "Retirement Accounts":
                             db.add_ira_holding(acc_id, symbol, shares)
                             st.success(f"Added {shares} shares of {symbol.upper()} to {name}")
                             st.rerun()
+
+    # --- Monte Carlo projection of the retirement accounts ---
+    st.subheader("Retirement Projection")
+    if accounts:
+        with st.form("retirement_projection_form"):
+            col1, col2, col3 = st.columns(3)
+            years = col1.number_input("Years", min_value=1, max_value=60, value=30, step=1)
+            paths = col2.select_slider("Simulated paths", options=[1_000, 5_000, 10_000, 25_000, 50_000, 100_000], value=10_000)
+            contribution_years = col3.number_input("Years of contributions", min_value=0, max_value=60, value=int(years), step=1)
+            col1, col2, col3, col4 = st.columns(4)
+            mean_return = col1.number_input("Expected return (%)", value=retirement.DEFAULT_MEAN_RETURN * 100, step=0.5) / 100
+            volatility = col2.number_input("Volatility (%)", min_value=0.0, value=retirement.DEFAULT_VOLATILITY * 100, step=0.5) / 100
+            contribution_growth = col3.number_input("Contribution growth (%/yr)", value=2.0, step=0.5) / 100
+            inflation = col4.number_input("Inflation (%/yr, 0 = nominal)", min_value=0.0, value=0.0, step=0.5) / 100
+            st.markdown("Annual contributions")
+            contributions = {}
+            for acc_id, name, acc_type, _ in accounts:
+                contributions[f"retirement:{acc_id}"] = st.number_input(
+                    f"{name} ($/yr)", min_value=0.0, step=500.0, key=f"contribution_{acc_id}")
+            parallel = st.checkbox("Spread over CPU cores (process pool)")
+            if st.form_submit_button("Run projection"):
+                with profiling.timer("retirement.projection"):
+                    st.session_state.projection = retirement.project(
+                        retirement.projection_accounts(contributions, mean_return, volatility),
+                        years=int(years), paths=paths, contribution_growth=contribution_growth,
+                        contribution_years=int(contribution_years), inflation=inflation,
+                        workers=(os.cpu_count() or 1) if parallel else 1,
+                    )
+        projection = st.session_state.get("projection")
+        if projection is not None:
+            final = dict(zip(projection.percentiles, projection.bands[:, -1]))
+            cols = st.columns(3)
+            cols[0].metric("Pessimistic (5th pct)", f"${final.get(5, 0.0):,.0f}")
+            cols[1].metric("Median", f"${final.get(50, 0.0):,.0f}")
+            cols[2].metric("Optimistic (95th pct)", f"${final.get(95, 0.0):,.0f}")
+            st.line_chart({f"{p}th pct": band for p, band in zip(projection.percentiles, projection.bands)})
+            st.caption(f"{projection.paths:,} simulated paths; mean final balance ${projection.mean_final:,.0f}.")
+    else:
+        st.info("Add a retirement account to project it.")
+
+# ---------------- Profiling Panel ----------------
+if profiling.enabled():
+    report = profiling.finish_render()
+    if report is not None:
+        profiling.log_report(report)
+        if st.session_state.get("show_profiling"):
+            with st.sidebar.expander("Render profile", expanded=True):
+                st.metric("Render time", f"{report['total_ms']:.1f} ms")
+                st.metric("DB queries", report["db_queries"])
+                rows = sorted(report["timings"].items(), key=lambda item: item[1]["total_ms"], reverse=True)
+                st.dataframe(
+                    [{"section": name, "calls": t["calls"], "total ms": round(t["total_ms"], 2), "max ms": round(t["max_ms"], 2)}
+                     for name, t in rows],
+                    hide_index=True,
+                )
+                st.download_button("Export JSON", profiling.report_json(report), file_name="render_profile.json", mime="application/json")
@@ -1,12 +1,76 @@
 import os
 import sys
+import threading
+import time
 
+START = time.perf_counter()
 
 # Get the directory where the executable/script is located
 base_dir = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
 # Reference the parent directory of the current directory
 parent_dir = os.path.dirname(base_dir)
 app_path = os.path.join(base_dir, "app.py")
+if not os.path.exists(app_path):
+    # Running from a source checkout (app/run_app.py); the modules live one level up
+    base_dir = parent_dir
+    app_path = os.path.join(base_dir, "app.py")
+# The app's modules, imported by the warm-up below and by app.py itself
+sys.path.insert(0, base_dir)
 
-# Use the absolute path to app.py, so it works regardless of working directory or PyInstaller bundle location
-os.system(f'streamlit run "{os.path.abspath(app_path)}"')
\ No newline at end of file
+# Server options (the same as `streamlit run` flags)
+FLAG_OPTIONS = {
+    "global.developmentMode": False,
+    "server.headless": False,
+}
+
+def _elapsed_ms() -> float:
+    return (time.perf_counter() - START) * 1000
+
+def warm_up():
+    # Runs while the server starts: open the DB, load the portfolio store and
+    # the cached quotes, and start the price refresher, so the first page
+    # renders from memory. app.py runs in this process and shares all of it.
+    try:
+        import db
+        import quote_cache
+        import refresher
+        import store
+        import valuation  # noqa: F401 (NumPy import)
+        db.init_db()
+        store.get_store().state
+        quote_cache.load_cached_prices()
+        refresher.start()
+        print(f"[startup] warm-up done in {_elapsed_ms():.0f} ms")
+    except Exception as e:
+        print(f"[startup] warm-up failed: {e}")
+
+def report_when_ready(timeout: float = 60):
+    # Poll the server's health endpoint and report when it first answers
+    import urllib.request
+    from streamlit import config
+    url = f"http://localhost:{config.get_option('server.port')}/_stcore/health"
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    print(f"[startup] server ready in {_elapsed_ms():.0f} ms")
+                    return
+        except OSError:
+            pass
+        time.sleep(0.05)
+
+def main():
+    # Boot the Streamlit server in this process instead of spawning `streamlit run`
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    from streamlit.web import bootstrap
+    bootstrap.load_config_options(flag_options=FLAG_OPTIONS)
+    threading.Thread(target=report_when_ready, name="startup-report", daemon=True).start()
+    print(f"[startup] starting server after {_elapsed_ms():.0f} ms")
+    bootstrap.run(app_path, False, [], FLAG_OPTIONS)
+
+if __name__ == "__main__":
+    # Process pools (e.g. the retirement projection) re-launch this executable when frozen
+    import multiprocessing
+    multiprocessing.freeze_support()
+    main()
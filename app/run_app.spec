@@ -1,16 +1,31 @@
 # -*- mode: python ; coding: utf-8 -*-
+from PyInstaller.utils.hooks import collect_data_files, copy_metadata
+
+# The app's modules are shipped as data files (app.py runs them as a script),
+# so the libraries they import are listed explicitly.
+hiddenimports = ['numpy', 'matplotlib.backends.backend_agg', 'yfinance', 'pandas', 'sqlite3']
+
+# Heavy modules nothing in the app uses (GUI toolkits, notebooks, test and
+# scientific stacks that some dependencies import optionally)
+excludes = [
+    'tkinter', '_tkinter', 'PyQt5', 'PyQt6', 'PySide2', 'PySide6', 'wx',
+    'IPython', 'ipykernel', 'jupyter_client', 'notebook',
+    'pytest', 'sphinx', 'docutils',
+    'scipy', 'sympy', 'sklearn', 'torch', 'tensorflow',
+    'matplotlib.backends.backend_qt5agg', 'matplotlib.backends.backend_tkagg',
+]
 
 
 a = Analysis(
     ['run_app.py'],
     pathex=[],
     binaries=[],
-    datas=[('../app.py', '.'), ('../db.py', '.'), ('../constants.py', '.'), ('../data_fetcher.py', '.'), ('../treasury.py', '.'), ('../retirement.py', '.')],
-    hiddenimports=[],
+    datas=[('../app.py', '.'), ('../db.py', '.'), ('../constants.py', '.'), ('../data_fetcher.py', '.'), ('../treasury.py', '.'), ('../retirement.py', '.'), ('../quote_cache.py', '.'), ('../valuation.py', '.'), ('../history.py', '.'), ('../price_history.py', '.'), ('../profiling.py', '.'), ('../read_cache.py', '.'), ('../dashboard.py', '.'), ('../importer.py', '.'), ('../migrations.py', '.'), ('../refresher.py', '.'), ('../store.py', '.'), ('../risk.py', '.'), ('../cashflows.py', '.'), ('../market_sim.py', '.'), ('../tax_lots.py', '.'), ('../live_valuation.py', '.')] + collect_data_files('streamlit') + copy_metadata('streamlit'),
+    hiddenimports=hiddenimports,
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=excludes,
     noarchive=False,
     optimize=0,
 )
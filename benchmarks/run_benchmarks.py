@@ -0,0 +1,189 @@
+"""Benchmark the app's data paths against a synthetic database.
+
+Builds a throwaway database through db.init_db, fills it with synthetic
+stocks, retirement accounts, IRA holdings, cash and treasuries, times the hot
+paths and writes the results as JSON so runs can be compared across versions.
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --stocks 1000 --accounts 100 --repeat 3
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import constants
+import dashboard
+import db
+import data_fetcher
+import live_valuation
+import market_sim
+import price_history
+import read_cache
+import risk
+import store
+import treasury
+
+TREASURY_TYPES = list(treasury.TYPE_CODES)
+
+def populate(stocks: int, accounts: int, holdings_per_account: int, treasuries: int, seed: int = 0):
+    # Bulk-load synthetic rows into the current DB_FILE
+    rng = random.Random(seed)
+    symbols = [f"S{i:05d}" for i in range(stocks)]
+    today = date.today()
+    with db.transaction() as conn:
+        conn.executemany('INSERT INTO stocks (symbol, shares) VALUES (?, ?)',
+                         [(symbol, rng.randint(1, 500)) for symbol in symbols])
+        for i in range(accounts):
+            acc_type = rng.choice(["IRA_traditional", "IRA_roth", "401k_traditional", "401k_roth"])
+            acc_id = conn.execute('INSERT INTO retirement_accounts (name, type, balance) VALUES (?, ?, ?)',
+                                  (f"Account {i}", acc_type, rng.uniform(0, 250_000))).lastrowid
+            if "IRA" in acc_type:
+                conn.executemany('INSERT INTO ira_holdings (account_id, symbol, shares) VALUES (?, ?, ?)',
+                                 [(acc_id, symbol, rng.randint(1, 200))
+                                  for symbol in rng.sample(symbols, min(holdings_per_account, len(symbols)))])
+        for name in ["SWVXX", "SPAXX", "Checking"]:
+            conn.execute('INSERT OR REPLACE INTO cash_accounts (name, balance) VALUES (?, ?)', (name, rng.uniform(0, 50_000)))
+        rows = []
+        for i in range(treasuries):
+            purchase = today - timedelta(days=rng.randint(0, 3650))
+            maturity = purchase + timedelta(days=rng.choice([91, 182, 365, 730, 1825, 3650, 7300, 10950]))
+            rows.append((f"T{i:05d}", rng.choice(TREASURY_TYPES), rng.choice([100, 1000, 10_000]),
+                         rng.uniform(0.005, 0.06), purchase.isoformat(), maturity.isoformat()))
+        conn.executemany('''
+            INSERT INTO treasuries (name, type, face_value, interest_rate, purchase_date, maturity_date)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+        db.mark_changed(*db.PORTFOLIO_TABLES)
+
+def measure(fn, repeat: int, setup=None):
+    # Run fn repeat times (after optional setup each time) and summarise wall time in seconds
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "max": max(times),
+    }
+
+def reset_treasury_cache():
+    read_cache.clear()
+
+def dashboard_data_prep():
+    # The data work of one Dashboard render with a cold read cache, without any Streamlit calls
+    read_cache.clear()
+    return dashboard.build_context()
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run(args) -> dict:
+    data_fetcher.USE_MOCK = True
+    # Mock prices come from the seeded market simulator, so runs see the same prices
+    data_fetcher.MOCK_SEED = args.seed
+    data_fetcher.set_mock_market(None)
+    workdir = tempfile.mkdtemp(prefix="financemanager-bench-")
+    db.DB_FILE = os.path.join(workdir, "bench.db")
+    db.init_db()
+    populate(args.stocks, args.accounts, args.holdings_per_account, args.treasuries, args.seed)
+    db.close_connections()
+
+    results = {}
+    results["init_db"] = measure(db.init_db, args.repeat)
+    results["store_load"] = measure(store.get_store().load, args.repeat)
+    # Single-row writes apply their delta to the store instead of reloading it
+    results["add_stock"] = measure(lambda: db.add_stock("S00000", 1), args.repeat)
+    results["get_portfolio_snapshot"] = measure(db.get_portfolio_snapshot.uncached, args.repeat)
+    results["get_treasury_book"] = measure(treasury.get_treasury_book.uncached, args.repeat)
+    results["calculate_total_treasuries_value"] = measure(treasury.calculate_total_treasuries_value, args.repeat, setup=reset_treasury_cache)
+    results["update_all_stock_prices_mock"] = measure(data_fetcher.update_all_stock_prices, args.repeat)
+    # One trading day of minute ticks for every held symbol, in one batch
+    market = market_sim.MarketSimulator(args.seed)
+    market.add_symbols(data_fetcher.get_tracked_symbols())
+    results["market_sim_day_of_ticks"] = measure(lambda: market.advance(390), args.repeat)
+    results["get_net_worth"] = measure(data_fetcher.get_net_worth, args.repeat)
+    # The same day of ticks applied to the live net worth, O(1) per tick
+    tracker = live_valuation.LiveValuation(db.DB_FILE)
+    tracker.rebuild()
+    tick_symbols = tracker.symbols()
+    day = market.advance(390, tick_symbols)[:, [market.symbols.index(s) for s in tick_symbols]]
+    day_ticks = [live_valuation.Tick(symbol, price) for row in day.tolist() for symbol, price in zip(tick_symbols, row)]
+    results["live_valuation_build"] = measure(tracker.rebuild, args.repeat)
+    results["live_valuation_day_of_ticks"] = measure(lambda: tracker.apply(day_ticks), args.repeat)
+    results["dashboard_data_prep"] = measure(dashboard_data_prep, args.repeat)
+    # A rerun with nothing changed is served from the versioned read cache
+    results["dashboard_rerun_cached"] = measure(dashboard.build_context, args.repeat)
+    # Risk over ten years of mock daily history: the first call builds the
+    # return matrix, later ones reuse it
+    constants.PRICE_HISTORY_DIR = os.path.join(workdir, "price_history")
+    risk_symbols = {f"S{i:05d}": 10.0 for i in range(args.risk_symbols)}
+    today = date.today()
+    price_history.ingest(risk_symbols, data_fetcher.mock_history_provider, today)
+    window = risk.WINDOWS["10 Years"]
+    results["risk_return_matrix_build"] = measure(lambda: risk.return_matrix(risk_symbols), args.repeat, setup=risk.clear_cache)
+    results["risk_report"] = measure(lambda: risk.risk_report(risk_symbols, window), args.repeat)
+    db.close_connections()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": {
+                "stocks": args.stocks,
+                "retirement_accounts": args.accounts,
+                "holdings_per_ira": args.holdings_per_account,
+                "treasuries": args.treasuries,
+                "risk_symbols": args.risk_symbols,
+            },
+            "database": db.DB_FILE,
+        },
+        "results": results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stocks", type=int, default=10_000)
+    parser.add_argument("--accounts", type=int, default=1_000)
+    parser.add_argument("--holdings-per-account", type=int, default=20)
+    parser.add_argument("--treasuries", type=int, default=5_000)
+    parser.add_argument("--risk-symbols", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        # One summary line per benchmark for humans
+        for name, stats in report["results"].items():
+            print(f"{name:36s} median {stats['median'] * 1000:9.2f} ms")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
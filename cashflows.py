@@ -0,0 +1,211 @@
+import threading
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+import constants
+import db
+import profiling
+import read_cache
+import store
+import treasury
+from treasury import BILL, COUPON, FRN, TIPS, SERIES_EE, SERIES_I, TYPE_CODES, OTHER
+
+# Treasury cash flows: every bond expanded into dated interest and principal
+# events, following the same rules as treasury.value_book:
+#   Bills: face at maturity, split into the price paid and the discount
+#     (face * rate * term / 360), which is the interest
+#   Notes/Bonds: semiannual coupons dated back from maturity, face at maturity
+#   FRN: the same, quarterly, at the stored rate
+#   TIPS: semiannual coupons and principal on the indexed principal (never below face)
+#   Series EE/I: face plus semiannually compounded interest at maturity
+#     (EE at least doubles after 20 years)
+#   Other: simple interest and face at maturity
+# Only coupons dated after the purchase date are counted.
+#
+# Schedules are memoized per bond (keyed on its name and terms), so after
+# add_treasury/remove_treasury only the changed bond is expanded again; the
+# monthly ladder is re-aggregated from the memoized flows in one pass.
+
+INTEREST, PRINCIPAL = 0, 1
+
+class CashFlows(NamedTuple):
+    names: Tuple[str, ...]
+    bond: np.ndarray        # index into names, per flow
+    dates: np.ndarray       # datetime64[D]
+    amounts: np.ndarray
+    kinds: np.ndarray       # INTEREST or PRINCIPAL
+
+class Ladder(NamedTuple):
+    months: np.ndarray      # datetime64[M], consecutive from the first month
+    interest: np.ndarray    # per month
+    principal: np.ndarray   # per month
+
+    @property
+    def total(self) -> np.ndarray:
+        return self.interest + self.principal
+
+class ReinvestmentGap(NamedTuple):
+    start: np.datetime64    # first month without a maturity (datetime64[M])
+    end: np.datetime64      # last one
+    months: int
+    idle_cash: float        # principal that matured just before the gap, waiting to be reinvested
+    interest: float         # interest paid during the gap
+
+Terms = Tuple[str, float, float, str, str]  # (type, face, rate, purchase date, maturity date)
+Schedule = Tuple[np.ndarray, np.ndarray, np.ndarray]  # (dates, amounts, kinds)
+
+_schedules: Dict[str, Dict[str, Tuple[Terms, Schedule]]] = {}   # db file -> name -> (terms, schedule)
+_lock = threading.Lock()
+
+@profiling.timed()
+def expand(terms: List[Terms]) -> List[Schedule]:
+    """Cash-flow schedules for a batch of bonds, expanded in one vectorized pass."""
+    if not terms:
+        return []
+    n = len(terms)
+    types = np.array([TYPE_CODES.get(t[0], OTHER) for t in terms], dtype=np.int8)
+    face = np.array([t[1] for t in terms], dtype=float)
+    rate = np.array([t[2] for t in terms], dtype=float)
+    purchase = treasury._parse_dates([t[3] for t in terms])
+    maturity = treasury._parse_dates([t[4] for t in terms])
+    term_days = np.maximum((maturity - purchase).astype(float), 0.0)
+
+    # Coupons: k = 0, 1, ... periods back from maturity, on the maturity's day
+    # of the month (clipped to the month's length), or on each month's last
+    # day when maturity falls on a month end
+    step = np.select([(types == COUPON) | (types == TIPS), types == FRN], [6, 3], default=0)
+    maturity_month = maturity.astype("datetime64[M]")
+    span = (maturity_month - purchase.astype("datetime64[M]")).astype(np.int64)
+    counts = np.where(step > 0, np.maximum(span, 0) // np.maximum(step, 1) + 1, 0)
+    idx = np.repeat(np.arange(n), counts)
+    k = np.arange(len(idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+    months = maturity_month[idx] - (k * step[idx]).astype("timedelta64[M]")
+    day = maturity[idx] - maturity_month[idx].astype("datetime64[D]")
+    month_end = maturity == (maturity_month + 1).astype("datetime64[D]") - 1
+    month_length = (months + 1).astype("datetime64[D]") - months.astype("datetime64[D]")
+    coupon_dates = months.astype("datetime64[D]") + np.where(month_end[idx], month_length - 1,
+                                                              np.minimum(day, month_length - 1))
+    keep = coupon_dates > purchase[idx]
+    idx, coupon_dates = idx[keep], coupon_dates[keep]
+    years = (coupon_dates - purchase[idx]).astype(float) / 365.25
+    indexed = np.where(types[idx] == TIPS, (1 + constants.TIPS_INFLATION_RATE) ** years, 1.0)
+    coupons = face[idx] * indexed * rate[idx] * step[idx] / 12
+
+    # At maturity: principal, plus the interest of types that pay it then
+    held_years = term_days / 365.25
+    discount = face * rate * term_days / 360
+    principal = np.select(
+        [types == TIPS, types == BILL],
+        [np.maximum(face * (1 + constants.TIPS_INFLATION_RATE) ** held_years, face), face - discount],
+        default=face,
+    )
+    savings = face * (1 + rate / 2) ** (2 * held_years)
+    savings = np.where((types == SERIES_EE) & (held_years >= 20), np.maximum(savings, 2 * face), savings)
+    interest = np.select(
+        [types == BILL, (types == SERIES_EE) | (types == SERIES_I), types == OTHER],
+        [discount, savings - face, face * rate * term_days / 365],
+        default=0.0,
+    )
+
+    bond = np.concatenate([idx, np.arange(n), np.arange(n)])
+    dates = np.concatenate([coupon_dates, maturity, maturity])
+    amounts = np.round(np.concatenate([coupons, interest, principal]), 2)
+    kinds = np.concatenate([np.full(len(idx), INTEREST), np.full(n, INTEREST), np.full(n, PRINCIPAL)]).astype(np.int8)
+    present = amounts != 0
+    bond, dates, amounts, kinds = bond[present], dates[present], amounts[present], kinds[present]
+    order = np.lexsort((kinds, dates, bond))
+    bond, dates, amounts, kinds = bond[order], dates[order], amounts[order], kinds[order]
+    bounds = np.searchsorted(bond, np.arange(1, n))
+    return list(zip(np.split(dates, bounds), np.split(amounts, bounds), np.split(kinds, bounds)))
+
+def _terms(record) -> Terms:
+    return (record["type"], float(record["face_value"]), float(record["interest_rate"]),
+            record["purchase_date"], record["maturity_date"])
+
+@profiling.timed()
+def schedules(treasuries=None, db_file: Optional[str] = None) -> Dict[str, Schedule]:
+    """{name: (dates, amounts, kinds)} for every treasury of the current database.
+
+    Bonds whose terms match the memoized ones reuse their schedule; new or
+    edited bonds are expanded together, and removed ones are forgotten.
+    """
+    db_file = db_file or db.current_db()
+    if treasuries is None:
+        treasuries = store.get_store(db_file).state.treasuries
+    with _lock:
+        memo = _schedules.setdefault(db_file, {})
+        wanted = {name: _terms(record) for name, record in treasuries.items()}
+        changed = [name for name, terms in wanted.items() if name not in memo or memo[name][0] != terms]
+        for name, schedule in zip(changed, expand([wanted[name] for name in changed])):
+            memo[name] = (wanted[name], schedule)
+        for name in set(memo) - set(wanted):
+            del memo[name]
+        return {name: memo[name][1] for name in wanted}
+
+@read_cache.cached("treasuries")
+def all_cash_flows() -> CashFlows:
+    # Every flow of every treasury as flat arrays
+    by_name = schedules()
+    names = tuple(by_name)
+    parts = list(by_name.values())
+    if not parts:
+        empty = np.zeros(0)
+        return CashFlows(names, empty.astype(np.int64), empty.astype("datetime64[D]"), empty, empty.astype(np.int8))
+    return CashFlows(
+        names=names,
+        bond=np.repeat(np.arange(len(parts)), [len(dates) for dates, _, _ in parts]),
+        dates=np.concatenate([dates for dates, _, _ in parts]),
+        amounts=np.concatenate([amounts for _, amounts, _ in parts]),
+        kinds=np.concatenate([kinds for _, _, kinds in parts]),
+    )
+
+@profiling.timed()
+@read_cache.cached("treasuries", daily=True)
+def monthly_ladder(months: Optional[int] = None) -> Ladder:
+    """Interest and principal received per month, from this month on.
+
+    months limits the horizon; by default it runs to the last maturity.
+    Flows already paid (before today) are left out.
+    """
+    flows = all_cash_flows()
+    today = np.datetime64(date.today(), "D")
+    future = flows.dates >= today
+    first = today.astype("datetime64[M]")
+    offsets = (flows.dates[future].astype("datetime64[M]") - first).astype(np.int64)
+    length = int(offsets.max()) + 1 if len(offsets) else 0
+    if months is not None:
+        length = min(length, months)
+    inside = offsets < length
+    amounts, kinds, offsets = flows.amounts[future][inside], flows.kinds[future][inside], offsets[inside]
+    return Ladder(
+        months=first + np.arange(length),
+        interest=np.bincount(offsets, weights=np.where(kinds == INTEREST, amounts, 0.0), minlength=length),
+        principal=np.bincount(offsets, weights=np.where(kinds == PRINCIPAL, amounts, 0.0), minlength=length),
+    )
+
+def reinvestment_gaps(ladder: Ladder, min_months: int = 1) -> List[ReinvestmentGap]:
+    """Runs of at least min_months months in the ladder with no principal maturing.
+
+    Each gap reports the principal that matured in the month just before it
+    (cash left idle unless reinvested to fill the gap) and the interest
+    received during it. A gap at the start reports no idle cash.
+    """
+    maturing = ladder.principal > 0
+    if not len(maturing):
+        return []
+    # Boundaries of the runs of months without a maturity
+    edges = np.diff(np.concatenate([[0], (~maturing).astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    interest = np.concatenate([[0.0], np.cumsum(ladder.interest)])
+    gaps = []
+    for start, end in zip(starts, ends):
+        if end - start < min_months:
+            continue
+        gaps.append(ReinvestmentGap(
+            start=ladder.months[start],
+            end=ladder.months[end - 1],
+            months=int(end - start),
+            idle_cash=round(float(ladder.principal[start - 1]), 2) if start > 0 else 0.0,
+            interest=round(float(interest[end] - interest[start]), 2),
+        ))
+    return gaps
@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Optional
+
+# Headless valuation of a portfolio database, for cron jobs and scripts:
+#
+#   python cli.py                        # cached prices, default database
+#   python cli.py --portfolio alice --prices live --positions
+#
+# valuation_report() is the importable equivalent. Only the libraries a
+# request needs are loaded: cached and mock prices never import yfinance,
+# pandas, matplotlib or streamlit.
+
+PRICE_SOURCES = ("cached", "mock", "live")
+
+def valuation_report(db_file: Optional[str] = None, prices: str = "cached",
+                     positions: bool = False) -> dict:
+    """Value a portfolio database and return the result as JSON-ready data.
+
+    prices: "cached" values at the last prices in the quote cache (no network),
+    "mock" at mock prices (the quote cache is left alone) and "live" fetches
+    fresh quotes, which also refreshes the quote cache. Raises
+    FileNotFoundError if the database doesn't exist (it is never created).
+    """
+    if prices not in PRICE_SOURCES:
+        raise ValueError(f"Unknown price source: {prices}")
+    import constants
+    import data_fetcher
+    import db
+    import quote_cache
+    import valuation
+
+    path = db_file or db.DB_FILE
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No database at {path}")
+    with db.use_database(path):
+        db.init_db()
+        snapshot = db.get_portfolio_snapshot()
+        symbols = snapshot.symbols()
+        quotes = quote_cache.load_cached_prices()
+        if prices == "mock":
+            price_map = data_fetcher.mock_quote_provider(symbols, data_fetcher.REQUEST_TIMEOUT)
+        else:
+            if prices == "live":
+                data_fetcher.refresh_prices(symbols, data_fetcher.yfinance_quote_provider, source="yfinance")
+                quotes = quote_cache.get_quotes()
+            price_map = constants.STOCK_PRICES
+        layout = valuation.build_positions(snapshot)
+        values = valuation.value_positions(layout, valuation.price_vector(layout, price_map))
+        report = {
+            "database": path,
+            "as_of": datetime.now().isoformat(timespec="seconds"),
+            "price_source": prices,
+            "net_worth": round(values.net_worth + constants.CASH, 2),
+            "by_category": {name: round(value, 2) for name, value in values.by_category.items()},
+            "accounts": [
+                {"key": account.key, "label": account.label, "category": account.category,
+                 "value": round(values.by_account[account.key], 2)}
+                for account in layout.accounts
+            ],
+            "missing_prices": sorted(symbol for symbol in symbols if symbol not in price_map),
+            "stale_prices": [] if prices == "mock" else quote_cache.get_stale_symbols(symbols, quotes),
+        }
+        if positions:
+            report["positions"] = [
+                {"account": account.key, "symbol": symbol, "shares": shares,
+                 "price": price_map.get(symbol, 0.0), "value": round(value, 2)}
+                for account, symbol, shares, value in valuation.iter_position_values(layout, values)
+            ]
+        db.close_connections()
+    return report
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Print a JSON valuation of a portfolio database.")
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument("--db", help="path of the database (default: the app's default database)")
+    where.add_argument("--portfolio", help="named portfolio, as in the app's ?portfolio=<name>")
+    parser.add_argument("--prices", choices=PRICE_SOURCES, default="cached",
+                        help="cached quotes (default, no network), mock prices or live quotes")
+    parser.add_argument("--positions", action="store_true", help="include every priced position")
+    parser.add_argument("--indent", type=int, default=2, help="JSON indent (0 for one line)")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    # Check the resolved file, so a mistyped name fails instead of valuing a new empty database
+    import db
+    try:
+        db_file = args.db or db.database_path(args.portfolio)
+    except ValueError as e:
+        parser.error(str(e))
+    if not os.path.exists(db_file):
+        parser.error(f"no database at {db_file}")
+    report = valuation_report(db_file, args.prices, args.positions)
+    text = json.dumps(report, indent=args.indent or None)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
+# Cash accounts shown in the app (balances live in each database's store, see store.py)
 CASH_ACCOUNTS = {
     "SWVXX": 0.0,
     "SPAXX": 0.0,
@@ -7,16 +8,11 @@ from typing import Dict
 
 CASH = 0
 
-PORTFOLIO: Dict[str, float] = {}
-
+# Latest price per symbol. Market data, so shared by every portfolio in the process.
 STOCK_PRICES: Dict[str, float] = {}
 
 NET_WORTH = 0.0
 
-TREASURIES = {
-
-}
-
 RETIREMENT_ACCOUNTS = {
     "401k_traditional": {"balance": 0},  # simple numeric
     "401k_roth": {"balance": 0},         # simple numeric
@@ -24,4 +20,32 @@ RETIREMENT_ACCOUNTS = {
     "IRA_roth": {"portfolio": {}}
 }
 
-PORTFOLIO_DB_FILE = "portfolio1.db"
\ No newline at end of file
+PORTFOLIO_DB_FILE = "portfolio1.db"
+# Databases of named portfolios (see db.database_path)
+PORTFOLIO_DB_DIR = "portfolios"
+
+# Quote cache freshness (seconds) per asset class; symbols not listed in
+# ASSET_CLASSES are treated as "equity".
+QUOTE_TTL_SECONDS = {
+    "equity": 15 * 60,
+    "etf": 15 * 60,
+    "mutual_fund": 24 * 60 * 60,
+}
+
+ASSET_CLASSES = {
+    "SPY": "etf",
+    "GLD": "etf",
+    "VGLT": "etf",
+    "VXUS": "etf",
+    "SWVXX": "mutual_fund",
+    "SPAXX": "mutual_fund",
+}
+
+# Treasury valuation: assumed annual inflation for indexing TIPS principal,
+# and whether to mark marketable treasuries to the cached yield curve.
+TIPS_INFLATION_RATE = 0.025
+MARK_TREASURIES_TO_MARKET = False
+
+# Local daily OHLCV store (see price_history.py) and how far back a new symbol is backfilled
+PRICE_HISTORY_DIR = "price_history"
+PRICE_HISTORY_START = "2015-01-01"
@@ -0,0 +1,73 @@
+from typing import FrozenSet, NamedTuple, Tuple
+import constants
+import db
+import profiling
+import read_cache
+import valuation
+
+# Everything one Dashboard render shows, computed in a single pass over the
+# valuation. The cards and the breakdown chart only read from this context.
+
+Metric = Tuple[str, str, str]  # (label, value, delta)
+
+class DashboardContext(NamedTuple):
+    snapshot: db.PortfolioSnapshot
+    valuation: valuation.Valuation
+    net_worth: float
+    portfolio_metrics: Tuple[Metric, ...]
+    ira_metrics: Tuple[Metric, ...]
+    retirement_balances: Tuple[Tuple[str, float], ...]  # (label, balance) for 401k accounts
+    treasury_totals: Tuple[Tuple[str, float], ...]      # (type, value)
+    cash_balances: Tuple[Tuple[str, float], ...]        # (account, balance)
+    breakdown: Tuple[Tuple[str, float], ...]            # (category, value) for the pie chart, non-zero only
+    stale_symbols: FrozenSet[str]
+
+# 401k categories shown on the IRA card, with their labels
+_RETIREMENT_BALANCE_LABELS = {
+    "Roth 401k": "Roth 401k Balance",
+    "Traditional 401k": "Traditional 401k Balance",
+}
+
+@profiling.timed()
+@read_cache.cached(*db.PORTFOLIO_TABLES, "prices", daily=True)
+def build_context(stale_symbols: FrozenSet[str] = frozenset()) -> DashboardContext:
+    snapshot, positions, values = valuation.current_valuation()
+    account_types = {f"retirement:{acc_id}": acc_type for acc_id, _, acc_type, _ in snapshot.retirement_accounts}
+
+    portfolio_metrics = []
+    ira_metrics = []
+    for account, symbol, shares, value in valuation.iter_position_values(positions, values):
+        price = constants.STOCK_PRICES.get(symbol, 0.0)
+        stale = " (stale)" if symbol in stale_symbols else ""
+        if account.key == "portfolio":
+            portfolio_metrics.append((f"{symbol} ({shares} shares){stale}", f"${price:.2f}", f"Value: ${value:.2f}"))
+        else:
+            ira_metrics.append((f"{account.label} ({account_types[account.key]}) - {symbol} ({shares} shares){stale}", f"${price:.2f}", f"Value: ${value:.2f}"))
+    if not portfolio_metrics:
+        portfolio_metrics.append(("No stocks in your portfolio yet.", "", ""))
+    if not ira_metrics:
+        ira_metrics.append(("No IRA equities yet.", "", ""))
+
+    categories_present = {account.category for account in positions.accounts}
+    retirement_balances = tuple(
+        (label, values.by_category[category])
+        for category, label in _RETIREMENT_BALANCE_LABELS.items() if category in categories_present
+    )
+    treasury_totals = tuple(
+        (account.label, values.by_account[account.key]) for account in positions.accounts if account.category == "Treasuries"
+    )
+    cash_balances = tuple((name, snapshot.cash.get(name, 0.0)) for name in constants.CASH_ACCOUNTS)
+    breakdown = tuple((category, round(value, 2)) for category, value in values.by_category.items() if value > 0)
+
+    return DashboardContext(
+        snapshot=snapshot,
+        valuation=values,
+        net_worth=values.net_worth + constants.CASH,
+        portfolio_metrics=tuple(portfolio_metrics),
+        ira_metrics=tuple(ira_metrics),
+        retirement_balances=retirement_balances,
+        treasury_totals=treasury_totals,
+        cash_balances=cash_balances,
+        breakdown=breakdown,
+        stale_symbols=stale_symbols,
+    )
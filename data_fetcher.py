@@ -1,10 +1,12 @@
-import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
 import constants
-from treasury import calculate_current_value
+import quote_cache
+from valuation import value_snapshot
 from constants import RETIREMENT_ACCOUNTS
 from retirement import get_ira_value, update_ira_stock_price
-
-import yfinance as yf
+import profiling
 
 # --- Configuration ---
 USE_MOCK = False  # True = use mock prices, False = use real API
@@ -23,112 +25,243 @@ MOCK_BASE_PRICES = {
     "INTC": 24.08,
     "GLD": 335.42,
     "VGLT": 57.18,
-    "VXUS": 73.09
+    "VXUS": 73.09,
+    # Treasury yield indices, in percent
+    "^IRX": 4.02,
+    "^FVX": 3.71,
+    "^TNX": 4.12,
+    "^TYX": 4.71
 }
 
 # ---------------- Mock Functions ----------------
+# Mock quotes come from a seeded market simulator (see market_sim.py), so
+# mock runs are repeatable. Quotes are read at the simulator's current tick;
+# the market moves one tick per mock refresh, for every symbol at once.
+MOCK_SEED = 0
+
+_mock_market = None
+
+def get_mock_market():
+    # The simulator behind mock quotes, created on first use from MOCK_SEED
+    global _mock_market
+    if _mock_market is None:
+        import market_sim
+        _mock_market = market_sim.MarketSimulator(MOCK_SEED, MOCK_BASE_PRICES)
+    return _mock_market
+
+def set_mock_market(market=None):
+    """Use market (a market_sim.MarketSimulator or ReplayMarket) for mock quotes.
+
+    None goes back to a fresh simulator seeded with MOCK_SEED.
+    """
+    global _mock_market
+    _mock_market = market
+
+def advance_mock_market(symbols: Iterable[str] = (), steps: int = 1):
+    # Move the mock market forward, adding symbols it does not know yet
+    get_mock_market().advance(steps, symbols)
+
 def get_mock_price(symbol: str) -> float:
-    """Return a mock price with slight random variation."""
-    base = MOCK_BASE_PRICES.get(symbol.upper(), 100.0)
-    jitter = base * (random.random() - 0.5) * 0.04  # ±2%
-    return round(base + jitter, 2)
+    """Return the mock market's current price for symbol."""
+    return get_mock_market().quotes([symbol])[symbol.upper()]
+
+def mock_quote_provider(symbols: List[str], timeout: float) -> Dict[str, float]:
+    # Read-only, so concurrent batches see the same tick
+    return get_mock_market().quotes(symbols)
 
 def update_stock_price_mock(symbol: str):
-    price = get_mock_price(symbol)
-    constants.STOCK_PRICES[symbol] = price
-
-def update_all_stock_prices_mock():
-    # Update prices for main portfolio
-    for symbol in constants.PORTFOLIO:
-        try:
-            update_stock_price_mock(symbol)
-        except Exception as e:
-            print(f"Failed to update {symbol} (mock): {e}")
-
-    # Update prices for all IRA holdings
-    import db
-    accounts = db.get_retirement_accounts()
-    ira_symbols = set()
-    for acc_id, name, acc_type, balance in accounts:
-        if "IRA" in acc_type:
-            holdings = db.get_ira_holdings(acc_id)
-            for _, symbol, _ in holdings:
-                ira_symbols.add(symbol.upper())
-    for symbol in ira_symbols:
-        try:
-            update_stock_price_mock(symbol)
-        except Exception as e:
-            print(f"Failed to update IRA {symbol} (mock): {e}")
+    advance_mock_market([symbol])
+    refresh_prices([symbol], mock_quote_provider, source="mock")
+
+def update_all_stock_prices_mock(snapshot=None):
+    symbols = get_tracked_symbols(snapshot)
+    advance_mock_market(symbols)
+    return refresh_prices(symbols, mock_quote_provider, source="mock")
 
 # ---------------- Real API Functions ----------------
+def yfinance_quote_provider(symbols: List[str], timeout: float) -> Dict[str, float]:
+    # One multi-ticker download per batch instead of a Ticker (and a fallback
+    # history call) per symbol. A few days are requested so symbols that did
+    # not trade today still have a last close.
+    import yfinance as yf  # heavy (pulls in pandas); only needed for live prices
+    data = yf.download(symbols, period="5d", interval="1d", group_by="column", auto_adjust=False,
+                       threads=False, progress=False, timeout=timeout)
+    if data is None or data.empty:
+        return {}
+    close = data["Close"].ffill()
+    if not hasattr(close, "columns"):
+        # Older yfinance returns a Series for a single ticker
+        close = close.to_frame(symbols[0])
+    last = close.iloc[-1]
+    return {str(symbol): float(price) for symbol, price in last.items() if price == price}
+
 def update_stock_price_api(symbol: str):
-    ticker = yf.Ticker(symbol)
-    price = None
-    try:
-        price = ticker.fast_info['last_price']
-    except Exception:
-        # fallback if fast_info fails
-        hist = ticker.history(period="1d")
-        if not hist.empty:
-            price = hist['Close'].iloc[-1]
-    if price is not None:
-        constants.STOCK_PRICES[symbol] = float(price)
-    else:
-        print(f"Failed to fetch price for {symbol} using yfinance.")
+    # refresh_prices reports a failed fetch
+    refresh_prices([symbol], yfinance_quote_provider, source="yfinance")
 
-def update_all_stock_prices_api():
-    for symbol in constants.PORTFOLIO:
-        try:
-            update_stock_price_api(symbol)
-        except Exception as e:
-            print(f"Failed to fetch {symbol} (API): {e}")
+def update_all_stock_prices_api(snapshot=None):
+    return refresh_prices(get_tracked_symbols(snapshot), yfinance_quote_provider, source="yfinance")
 
-    # Update prices for all IRA holdings
-    import db
-    accounts = db.get_retirement_accounts()
-    ira_symbols = set()
-    for acc_id, name, acc_type, balance in accounts:
-        if "IRA" in acc_type:
-            holdings = db.get_ira_holdings(acc_id)
-            for _, symbol, _ in holdings:
-                ira_symbols.add(symbol.upper())
-    for symbol in ira_symbols:
-        try:
-            update_stock_price_api(symbol)
-        except Exception as e:
-            print(f"Failed to fetch IRA {symbol} (API): {e}")
+# ---------------- Daily History Providers ----------------
+# Used by price_history.ingest: {symbol: {"date", "open", "high", "low", "close", "volume"}}
+MOCK_HISTORY_ORIGIN = "2000-01-03"
 
-# ---------------- Shared Functions ----------------
+def mock_history_provider(symbols: List[str], start, end) -> Dict[str, dict]:
+    # Deterministic per-symbol random walk over business days in [start, end).
+    # The walk always starts at MOCK_HISTORY_ORIGIN so incremental fetches line up.
+    import zlib
+    import numpy as np
+    days = np.arange(np.datetime64(MOCK_HISTORY_ORIGIN, "D"), np.datetime64(end, "D"))
+    days = days[np.is_busday(days)]
+    keep = days >= np.datetime64(start, "D")
+    result = {}
+    for symbol in symbols:
+        rng = np.random.default_rng(zlib.crc32(symbol.upper().encode()))
+        base = MOCK_BASE_PRICES.get(symbol.upper(), 100.0)
+        close = base * np.exp(np.cumsum(rng.normal(0.0, 0.015, len(days))))
+        spread = close * rng.uniform(0, 0.01, len(days))
+        volume = rng.integers(100_000, 10_000_000, len(days)).astype(float)
+        result[symbol] = {
+            "date": days[keep],
+            "open": (close - spread / 2)[keep],
+            "high": (close + spread)[keep],
+            "low": (close - spread)[keep],
+            "close": close[keep],
+            "volume": volume[keep],
+        }
+    return result
 
-def get_net_worth() -> float:
-    total = constants.CASH
+def yfinance_history_provider(symbols: List[str], start, end) -> Dict[str, dict]:
+    # One multi-ticker download for the whole batch
+    import yfinance as yf
+    data = yf.download(symbols, start=start.isoformat(), end=end.isoformat(), interval="1d", group_by="ticker",
+                       auto_adjust=False, threads=True, progress=False, timeout=REQUEST_TIMEOUT)
+    result = {}
+    if data is None or data.empty:
+        return result
+    for symbol in symbols:
+        if data.columns.nlevels > 1:
+            if symbol not in data.columns.get_level_values(0):
+                continue
+            frame = data[symbol]
+        else:
+            frame = data
+        frame = frame.dropna(subset=["Close"])
+        if frame.empty:
+            continue
+        result[symbol] = {
+            "date": frame.index.values.astype("datetime64[D]"),
+            "open": frame["Open"].to_numpy(dtype=float),
+            "high": frame["High"].to_numpy(dtype=float),
+            "low": frame["Low"].to_numpy(dtype=float),
+            "close": frame["Close"].to_numpy(dtype=float),
+            "volume": frame["Volume"].to_numpy(dtype=float),
+        }
+    return result
+
+# ---------------- Refresh Pipeline ----------------
+# A quote provider takes a batch of symbols and a per-request timeout (seconds)
+# and returns {symbol: price} for the symbols it could price. Tests can pass a
+# local stub in place of the yfinance or mock providers.
+QuoteProvider = Callable[[List[str], float], Dict[str, float]]
 
-    # Add main portfolio
-    for symbol, shares in constants.PORTFOLIO.items():
-        total += constants.STOCK_PRICES.get(symbol, 0.0) * shares
+BATCH_SIZE = 50           # symbols per provider request
+MAX_WORKERS = 4           # concurrent provider requests
+REQUEST_TIMEOUT = 10.0    # seconds allowed for a single provider request
+TOTAL_BUDGET = 30.0       # seconds allowed for the whole refresh
 
-    # Add treasuries
-    for name in constants.TREASURIES:
-        total += calculate_current_value(name)
+class PriceResult(NamedTuple):
+    symbol: str
+    price: Optional[float]
+    status: str               # "ok", "missing", "error" or "timeout"
+    error: Optional[str] = None
+    elapsed: float = 0.0      # seconds spent on the symbol's batch
 
-    # Add retirement accounts from DB
+@profiling.timed()
+def get_tracked_symbols(snapshot=None) -> List[str]:
+    # Deduplicated union of taxable portfolio and IRA symbols
+    if snapshot is not None:
+        return snapshot.symbols()
     import db
-    accounts = db.get_retirement_accounts()
-    for acc_id, name, acc_type, balance in accounts:
-        if "IRA" in acc_type:
-            # Sum value of IRA holdings using current prices
-            holdings = db.get_ira_holdings(acc_id)
-            ira_total = 0.0
-            for _, symbol, shares in holdings:
-                price = constants.STOCK_PRICES.get(symbol.upper(), 0.0)
-                ira_total += price * shares
-            total += ira_total
+    import store
+    symbols = {symbol.upper() for symbol in store.current().stocks}
+    symbols.update(db.get_ira_symbols())
+    return sorted(symbols)
+
+def _fetch_batch(provider: QuoteProvider, batch: List[str], timeout: float):
+    start = time.perf_counter()
+    prices = provider(batch, timeout)
+    return prices, time.perf_counter() - start
+
+@profiling.timed()
+def refresh_prices(symbols: Iterable[str], provider: QuoteProvider, batch_size: int = BATCH_SIZE,
+                   max_workers: int = MAX_WORKERS, request_timeout: float = REQUEST_TIMEOUT,
+                   total_budget: float = TOTAL_BUDGET, source: Optional[str] = None) -> Dict[str, PriceResult]:
+    """Fetch prices for symbols in concurrent batches and store them in STOCK_PRICES.
+
+    Returns one PriceResult per symbol. Batches still running when the total
+    budget runs out are reported as "timeout" and their results are dropped.
+    When source is given, fetched prices are also written to the quote cache.
+    """
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+    results: Dict[str, PriceResult] = {}
+    if not symbols:
+        return results
+    batches = [symbols[i:i + batch_size] for i in range(0, len(symbols), batch_size)]
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(batches)))
+    try:
+        futures = {executor.submit(_fetch_batch, provider, batch, request_timeout): batch for batch in batches}
+        done, not_done = wait(futures, timeout=total_budget)
+        for future in done:
+            batch = futures[future]
+            try:
+                prices, elapsed = future.result()
+            except Exception as e:
+                for symbol in batch:
+                    results[symbol] = PriceResult(symbol, None, "error", str(e))
+                continue
+            for symbol in batch:
+                price = prices.get(symbol)
+                if price is None:
+                    results[symbol] = PriceResult(symbol, None, "missing", None, elapsed)
+                else:
+                    results[symbol] = PriceResult(symbol, float(price), "ok", None, elapsed)
+        for future in not_done:
+            for symbol in futures[future]:
+                results[symbol] = PriceResult(symbol, None, "timeout", f"exceeded {total_budget}s budget")
+    finally:
+        # Don't block on stragglers past the budget
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    results = {symbol: results[symbol] for symbol in symbols}
+    for symbol, result in results.items():
+        if result.price is not None:
+            constants.STOCK_PRICES[symbol] = result.price
         else:
-            total += balance
+            print(f"Failed to update {symbol}: {result.status}" + (f" ({result.error})" if result.error else ""))
+    if any(result.price is not None for result in results.values()):
+        import db
+        db.bump_data_version("prices")
+    if source is not None:
+        fetched = {symbol: result.price for symbol, result in results.items() if result.price is not None}
+        if fetched:
+            quote_cache.store_quotes(fetched, source)
+    return results
 
-    return total
+# ---------------- Shared Functions ----------------
+
+@profiling.timed()
+def get_net_worth(snapshot=None) -> float:
+    # Net worth excluding cash accounts, which the Dashboard adds on its own.
+    # Pass a db.PortfolioSnapshot to share one read with other consumers.
+    if snapshot is None:
+        import db
+        snapshot = db.get_portfolio_snapshot()
+    valuation = value_snapshot(snapshot)
+    return constants.CASH + valuation.net_worth - valuation.by_category["Cash Accounts"]
 
 # ---------------- Public Interface ----------------
+@profiling.timed()
 def update_stock_price(symbol: str):
     """Update a single stock price based on toggle."""
     if USE_MOCK:
@@ -136,9 +269,32 @@ def update_stock_price(symbol: str):
     else:
         update_stock_price_api(symbol)
 
-def update_all_stock_prices():
-    # Update all stock prices based on toggle.
+@profiling.timed()
+def update_all_stock_prices(snapshot=None):
+    # Update all stock prices based on toggle. Returns a PriceResult per symbol.
     if USE_MOCK:
-        update_all_stock_prices_mock()
+        return update_all_stock_prices_mock(snapshot)
     else:
-        update_all_stock_prices_api()
+        return update_all_stock_prices_api(snapshot)
+
+@profiling.timed()
+def update_stock_prices(symbols: Iterable[str]):
+    # Update the given symbols based on toggle. Returns a PriceResult per symbol.
+    provider, source = get_quote_provider()
+    if USE_MOCK:
+        symbols = list(symbols)
+        advance_mock_market(symbols)
+    return refresh_prices(symbols, provider, source=source)
+
+def get_quote_provider():
+    # (quote provider, quote cache source name) based on toggle
+    return (mock_quote_provider, "mock") if USE_MOCK else (yfinance_quote_provider, "yfinance")
+
+def get_history_provider():
+    # Daily history provider based on toggle
+    return mock_history_provider if USE_MOCK else yfinance_history_provider
+
+def update_yield_curve():
+    # Refresh the treasury yield indices in the quote cache (see treasury.get_cached_yield_curve)
+    from treasury import YIELD_CURVE_TICKERS
+    return update_stock_prices(YIELD_CURVE_TICKERS.values())
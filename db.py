@@ -1,211 +1,468 @@
-def update_stock_shares(symbol: str, shares: float):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('UPDATE stocks SET shares = ? WHERE symbol = ?', (shares, symbol.upper()))
-    conn.commit()
-    conn.close()
-    load_portfolio_from_db()
+import contextvars
+import os
+import re
 import sqlite3
-from constants import PORTFOLIO, PORTFOLIO_DB_FILE
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+from constants import PORTFOLIO_DB_DIR, PORTFOLIO_DB_FILE
+import migrations
+import profiling
+import read_cache
 
+# Process-wide default database. Code serving several portfolios selects one
+# per thread/context with use_database() or select_database(); everything
+# below works on current_db().
 DB_FILE = PORTFOLIO_DB_FILE
 
+_db_file: contextvars.ContextVar = contextvars.ContextVar("db_file", default=None)
+
+def current_db() -> str:
+    return _db_file.get() or DB_FILE
+
+def select_database(path: Optional[str]):
+    # Use path for the rest of the current context (None restores the default)
+    _db_file.set(path)
+
+@contextmanager
+def use_database(path: str):
+    token = _db_file.set(path)
+    try:
+        yield path
+    finally:
+        _db_file.reset(token)
+
+PORTFOLIO_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def database_path(name: Optional[str]) -> str:
+    # DB file for a named portfolio (one per household/user); the default DB for no name
+    if not name:
+        return DB_FILE
+    if not PORTFOLIO_NAME_RE.match(name):
+        raise ValueError(f"Invalid portfolio name: {name!r}")
+    os.makedirs(PORTFOLIO_DB_DIR, exist_ok=True)
+    return os.path.join(PORTFOLIO_DB_DIR, f"{name}.db")
+
+# Tables that make up a portfolio (everything in a PortfolioSnapshot)
+PORTFOLIO_TABLES = ("stocks", "cash_accounts", "retirement_accounts", "ira_holdings", "treasuries")
+
+# --- Connection Management ---
+# Connections stay open per thread (and per DB file) and are reused by every
+# function below, so their prepared-statement cache survives between calls.
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+def _configure_connection(conn: sqlite3.Connection):
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+
+def get_connection() -> sqlite3.Connection:
+    # Return this thread's open connection to current_db(), creating it on first use.
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    db_file = current_db()
+    conn = connections.get(db_file)
+    if conn is None:
+        # isolation_level=None: statements autocommit unless wrapped in transaction()
+        conn = sqlite3.connect(db_file, isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
+        _configure_connection(conn)
+        connections[db_file] = conn
+    # Count statements for the per-render profile (see profiling.count_query);
+    # the callback is removed again when profiling is off, so unprofiled
+    # statements don't call into Python
+    traced = getattr(_local, "traced", None)
+    if traced is None:
+        traced = _local.traced = set()
+    if profiling.enabled() != (db_file in traced):
+        if db_file in traced:
+            conn.set_trace_callback(None)
+            traced.discard(db_file)
+        else:
+            conn.set_trace_callback(profiling.count_query)
+            traced.add(db_file)
+    return conn
+
+def close_connections():
+    # Close every connection opened by the calling thread.
+    connections = getattr(_local, "connections", None) or {}
+    getattr(_local, "traced", set()).clear()
+    for db_file, conn in connections.items():
+        conn.close()
+        # Closing may checkpoint the WAL, which is not an external change
+        if db_file in _file_signatures:
+            _file_signatures[db_file] = _file_signature(db_file)
+    connections.clear()
+
+# --- Data Versions and Change Events ---
+# Process-wide change counters per (DB file, table). Writes mark the tables
+# they touch and the counters are bumped when the outermost transaction
+# commits, so caches keyed on data_version() (see read_cache.py) are
+# invalidated by exactly the writes that affect them. Non-table sources such
+# as "prices" can be bumped directly; PROCESS_WIDE_SOURCES are shared by all
+# databases (prices live in constants.STOCK_PRICES). Every bump is also
+# delivered as a ChangeEvent to the listeners registered with subscribe().
+PROCESS_WIDE_SOURCES = ("prices",)
+
+_versions: Dict[Tuple[str, str], int] = {}
+_versions_lock = threading.Lock()
+
+class ChangeEvent(NamedTuple):
+    db_file: str
+    names: FrozenSet[str]   # tables (or other sources) that changed
+    external: bool          # True when made outside this process (see detect_external_change)
+
+_listeners: List[Callable[[ChangeEvent], None]] = []
+
+def subscribe(listener: Callable[[ChangeEvent], None]):
+    # Register a change listener; returns it, so it can be used as a decorator
+    _listeners.append(listener)
+    return listener
+
+def _version_key(name: str) -> Tuple[str, str]:
+    return ("" if name in PROCESS_WIDE_SOURCES else current_db(), name)
+
+def data_version(*names: str) -> Tuple[int, ...]:
+    return tuple(_versions.get(_version_key(name), 0) for name in names)
+
+def bump_data_version(*names: str, external: bool = False):
+    if not names:
+        return
+    with _versions_lock:
+        for name in names:
+            key = _version_key(name)
+            _versions[key] = _versions.get(key, 0) + 1
+    event = ChangeEvent(current_db(), frozenset(names), external)
+    for listener in list(_listeners):
+        listener(event)
+
+def mark_changed(*tables: str):
+    # Record tables written by the current transaction (bumped on commit)
+    if not get_connection().in_transaction:
+        _record_own_write()
+        bump_data_version(*tables)
+        return
+    pending = getattr(_local, "pending_changes", None)
+    if pending is None:
+        pending = _local.pending_changes = set()
+    pending.update(tables)
+
+def on_commit(callback: Callable[[], None]):
+    """Run callback once the current transaction commits (now, outside one).
+
+    Used to apply write-through deltas to in-memory state: they are dropped
+    on rollback and run before the change event for the write goes out.
+    """
+    if not get_connection().in_transaction:
+        callback()
+        return
+    callbacks = getattr(_local, "pending_callbacks", None)
+    if callbacks is None:
+        callbacks = _local.pending_callbacks = []
+    callbacks.append(callback)
+
+def _take_pending_changes() -> Tuple[set, list]:
+    pending = getattr(_local, "pending_changes", None) or set()
+    callbacks = getattr(_local, "pending_callbacks", None) or []
+    _local.pending_changes = set()
+    _local.pending_callbacks = []
+    return pending, callbacks
+
+# --- External Change Detection ---
+# The size and mtime of the DB file and its WAL, recorded after each write
+# made by this process. A different signature means another process wrote
+# to the file.
+_file_signatures: Dict[str, Tuple] = {}
+
+def _file_signature(db_file: str) -> Tuple:
+    signature = []
+    for path in (db_file, db_file + "-wal"):
+        try:
+            st = os.stat(path)
+            signature.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+def _record_own_write():
+    db_file = current_db()
+    _file_signatures[db_file] = _file_signature(db_file)
+
+def detect_external_change() -> bool:
+    """Check whether another process changed current_db() since our last write or check.
+
+    On a change every data version for the file is bumped with
+    external=True, so caches are dropped and in-memory stores reload.
+    """
+    db_file = current_db()
+    signature = _file_signature(db_file)
+    previous = _file_signatures.get(db_file)
+    _file_signatures[db_file] = signature
+    if previous is None or previous == signature:
+        return False
+    with _versions_lock:
+        names = {name for key_db, name in _versions if key_db == db_file}
+    bump_data_version(*(names | set(PORTFOLIO_TABLES)), external=True)
+    return True
+
+@contextmanager
+def transaction(immediate: bool = True):
+    """Run the enclosed statements in one transaction on this thread's connection.
+
+    Nested use joins the outermost transaction, so helpers that open their own
+    transaction can be composed into a larger atomic write. Pass
+    immediate=False for read-only work that just needs a consistent view.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+    written = conn.total_changes
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        _take_pending_changes()
+        raise
+    else:
+        conn.commit()
+        changes, callbacks = _take_pending_changes()
+        # Any row written here (marked or not, e.g. history snapshots) moved
+        # the file's signature; record it so it isn't taken for another process
+        if changes or conn.total_changes != written:
+            _record_own_write()
+        for callback in callbacks:
+            callback()
+        bump_data_version(*changes)
+
 # --- Cash Accounts DB Functions ---
+@profiling.timed()
+@read_cache.cached("cash_accounts")
 def get_cash_accounts():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT name, balance FROM cash_accounts')
-    rows = c.fetchall()
-    conn.close()
+    rows = get_connection().execute('SELECT name, balance FROM cash_accounts').fetchall()
     return {name: balance for name, balance in rows}
 
+@profiling.timed()
 def set_cash_account(name: str, balance: float):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('INSERT OR REPLACE INTO cash_accounts (name, balance) VALUES (?, ?)', (name, balance))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('INSERT OR REPLACE INTO cash_accounts (name, balance) VALUES (?, ?)', (name, balance))
+        mark_changed("cash_accounts")
+        apply_store_changes(cash={name: balance})
 # --- Retirement Accounts DB Functions ---
+@profiling.timed()
 def add_retirement_account(name: str, acc_type: str, balance: float = 0.0) -> int:
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('INSERT INTO retirement_accounts (name, type, balance) VALUES (?, ?, ?)', (name, acc_type, balance))
-    conn.commit()
-    account_id = c.lastrowid
-    conn.close()
-    return account_id
+    with transaction() as conn:
+        c = conn.execute('INSERT INTO retirement_accounts (name, type, balance) VALUES (?, ?, ?)', (name, acc_type, balance))
+        mark_changed("retirement_accounts")
+        return c.lastrowid
 
+@profiling.timed()
+@read_cache.cached("retirement_accounts")
 def get_retirement_accounts():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT id, name, type, balance FROM retirement_accounts')
-    accounts = c.fetchall()
-    conn.close()
-    return accounts
+    return get_connection().execute('SELECT id, name, type, balance FROM retirement_accounts').fetchall()
 
+@profiling.timed()
 def update_retirement_account_balance(account_id: int, balance: float):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('UPDATE retirement_accounts SET balance = ? WHERE id = ?', (balance, account_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('UPDATE retirement_accounts SET balance = ? WHERE id = ?', (balance, account_id))
+        mark_changed("retirement_accounts")
 
+@profiling.timed()
 def remove_retirement_account(account_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('DELETE FROM retirement_accounts WHERE id = ?', (account_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('DELETE FROM retirement_accounts WHERE id = ?', (account_id,))
+        # Holdings go with the account (ON DELETE CASCADE), and so do its tax lots (trigger)
+        mark_changed("retirement_accounts", "ira_holdings", "lots")
 
 # --- IRA Holdings DB Functions ---
+@profiling.timed()
 def add_ira_holding(account_id: int, symbol: str, shares: float):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('INSERT INTO ira_holdings (account_id, symbol, shares) VALUES (?, ?, ?)', (account_id, symbol.upper(), shares))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('''
+            INSERT INTO ira_holdings (account_id, symbol, shares) VALUES (?, ?, ?)
+            ON CONFLICT (account_id, symbol) DO UPDATE SET shares = shares + excluded.shares
+        ''', (account_id, symbol.upper(), shares))
+        mark_changed("ira_holdings")
 
+@profiling.timed()
+@read_cache.cached("ira_holdings")
 def get_ira_holdings(account_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT id, symbol, shares FROM ira_holdings WHERE account_id = ?', (account_id,))
-    holdings = c.fetchall()
-    conn.close()
-    return holdings
+    return get_connection().execute('SELECT id, symbol, shares FROM ira_holdings WHERE account_id = ?', (account_id,)).fetchall()
+
+@profiling.timed()
+@read_cache.cached("ira_holdings", "retirement_accounts")
+def get_ira_symbols():
+    # Distinct symbols held across all IRA accounts, in one query
+    rows = get_connection().execute('''
+        SELECT DISTINCT UPPER(h.symbol) FROM ira_holdings h
+        JOIN retirement_accounts a ON a.id = h.account_id
+        WHERE instr(a.type, 'IRA') > 0
+    ''').fetchall()
+    return [symbol for (symbol,) in rows]
 
+def _close_excess_lots(positions):
+    # Shares removed or reduced outside a sale take their tax lots with them (see tax_lots.py)
+    import tax_lots
+    tax_lots.close_excess_lots(positions)
+
+@profiling.timed()
 def remove_ira_holding(holding_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('DELETE FROM ira_holdings WHERE id = ?', (holding_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        position = conn.execute('SELECT account_id, symbol FROM ira_holdings WHERE id = ?', (holding_id,)).fetchall()
+        conn.execute('DELETE FROM ira_holdings WHERE id = ?', (holding_id,))
+        mark_changed("ira_holdings")
+        _close_excess_lots(position)
 
+@profiling.timed()
 def update_ira_holding_shares(holding_id: int, shares: float):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('UPDATE ira_holdings SET shares = ? WHERE id = ?', (shares, holding_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        position = conn.execute('SELECT account_id, symbol FROM ira_holdings WHERE id = ?', (holding_id,)).fetchall()
+        conn.execute('UPDATE ira_holdings SET shares = ? WHERE id = ?', (shares, holding_id))
+        mark_changed("ira_holdings")
+        _close_excess_lots(position)
 
+@profiling.timed()
 def init_db():
-    # Add cash_accounts table
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS cash_accounts (
-            name TEXT PRIMARY KEY,
-            balance REAL NOT NULL
-        )
-    ''')
-    # Add stocks table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS stocks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            symbol TEXT NOT NULL,
-            shares REAL NOT NULL
-        )
-    ''')
-    # Add retirement_accounts table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS retirement_accounts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            type TEXT NOT NULL, -- e.g., IRA, 401k, etc.
-            balance REAL DEFAULT 0.0
-        )
-    ''')
-    # Add ira_holdings table (for equities inside IRA accounts)
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS ira_holdings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            account_id INTEGER NOT NULL,
-            symbol TEXT NOT NULL,
-            shares REAL NOT NULL,
-            FOREIGN KEY(account_id) REFERENCES retirement_accounts(id) ON DELETE CASCADE
-        )
-    ''')
-    # Add treasuries table (now with 'type' column)
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS treasuries (
-            name TEXT PRIMARY KEY,
-            type TEXT NOT NULL,
-            face_value REAL NOT NULL,
-            interest_rate REAL NOT NULL,
-            purchase_date TEXT NOT NULL,
-            maturity_date TEXT NOT NULL
-        )
-    ''')
-    conn.commit()
-    conn.close()
-    # Load DB into in-memory constants
-    load_portfolio_from_db()
+    # Create or upgrade the schema (see migrations.py)
+    with transaction() as c:
+        if migrations.migrate(c):
+            mark_changed(*PORTFOLIO_TABLES)
+    # The in-memory store (see store.py) loads on first use and is kept
+    # current by writes; only an external change makes it reload
+    detect_external_change()
 
 # --- Treasuries DB Functions ---
+@profiling.timed()
 def add_treasury_db(name: str, ttype: str, face_value: float, interest_rate: float, purchase_date: str, maturity_date: str):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        INSERT OR REPLACE INTO treasuries (name, type, face_value, interest_rate, purchase_date, maturity_date)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (name, ttype, face_value, interest_rate, purchase_date, maturity_date))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO treasuries (name, type, face_value, interest_rate, purchase_date, maturity_date)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (name, ttype, face_value, interest_rate, purchase_date, maturity_date))
+        mark_changed("treasuries")
+        apply_store_changes(treasuries={name: treasury_record(ttype, face_value, interest_rate, purchase_date, maturity_date)})
+
+def treasury_record(ttype: str, face_value: float, interest_rate: float, purchase_date: str, maturity_date: str) -> dict:
+    # In-memory form of a treasuries row (see store.PortfolioState.treasuries)
+    return {
+        "type": ttype,
+        "face_value": face_value,
+        "interest_rate": interest_rate,
+        "purchase_date": purchase_date,
+        "maturity_date": maturity_date
+    }
 
+@profiling.timed()
+@read_cache.cached("treasuries")
 def get_treasuries_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT name, type, face_value, interest_rate, purchase_date, maturity_date FROM treasuries')
-    rows = c.fetchall()
-    conn.close()
-    return rows
+    return get_connection().execute('SELECT name, type, face_value, interest_rate, purchase_date, maturity_date FROM treasuries').fetchall()
 
+@profiling.timed()
 def remove_treasury_db(name: str):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('DELETE FROM treasuries WHERE name = ?', (name,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('DELETE FROM treasuries WHERE name = ?', (name,))
+        mark_changed("treasuries")
+        apply_store_changes(treasuries={name: None})
 
+@profiling.timed()
 def update_treasury_db(name: str, face_value: float, interest_rate: float, purchase_date: str, maturity_date: str):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        UPDATE treasuries SET face_value = ?, interest_rate = ?, purchase_date = ?, maturity_date = ?
-        WHERE name = ?
-    ''', (face_value, interest_rate, purchase_date, maturity_date, name))
-    conn.commit()
-    conn.close()
-def load_portfolio_from_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT symbol, shares FROM stocks')
-    rows = c.fetchall()
-    conn.close()
-    # Update in-memory PORTFOLIO
-    PORTFOLIO.clear()
-    for symbol, shares in rows:
-        PORTFOLIO[symbol] = shares
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE treasuries SET face_value = ?, interest_rate = ?, purchase_date = ?, maturity_date = ?
+            WHERE name = ?
+        ''', (face_value, interest_rate, purchase_date, maturity_date, name))
+        mark_changed("treasuries")
+        row = conn.execute('SELECT type FROM treasuries WHERE name = ?', (name,)).fetchone()
+        if row:
+            apply_store_changes(treasuries={name: treasury_record(row[0], face_value, interest_rate, purchase_date, maturity_date)})
+
+def apply_store_changes(**changes):
+    # Write-through deltas for the in-memory store of the current DB, applied
+    # once the current transaction commits (see store.PortfolioStore.apply)
+    import store
+    db_file = current_db()
+    on_commit(lambda: store.get_store(db_file).apply(**changes))
 
+@profiling.timed()
 def add_stock(symbol: str, shares: float):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT shares FROM stocks WHERE symbol = ?', (symbol.upper(),))
-    result = c.fetchone()
-    if result:
-        new_shares = result[0] + shares
-        c.execute('UPDATE stocks SET shares = ? WHERE symbol = ?', (new_shares, symbol.upper()))
-    else:
-        c.execute('INSERT INTO stocks (symbol, shares) VALUES (?, ?)', (symbol.upper(), shares))
-    conn.commit()
-    conn.close()
-    # Update in-memory PORTFOLIO
-    load_portfolio_from_db()
+    symbol = symbol.upper()
+    with transaction() as conn:
+        conn.execute('''
+            INSERT INTO stocks (symbol, shares) VALUES (?, ?)
+            ON CONFLICT (symbol) DO UPDATE SET shares = shares + excluded.shares
+        ''', (symbol, shares))
+        new_shares = conn.execute('SELECT shares FROM stocks WHERE symbol = ?', (symbol,)).fetchone()[0]
+        mark_changed("stocks")
+        apply_store_changes(stocks={symbol: new_shares})
+
+@profiling.timed()
+def update_stock_shares(symbol: str, shares: float):
+    symbol = symbol.upper()
+    with transaction() as conn:
+        c = conn.execute('UPDATE stocks SET shares = ? WHERE symbol = ?', (shares, symbol))
+        mark_changed("stocks")
+        if c.rowcount:
+            apply_store_changes(stocks={symbol: shares})
+            _close_excess_lots([(0, symbol)])
 
+@profiling.timed()
 def remove_stock(symbol: str):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('DELETE FROM stocks WHERE symbol = ?', (symbol.upper(),))
-    conn.commit()
-    conn.close()
-    # Update in-memory PORTFOLIO
-    load_portfolio_from_db()
+    symbol = symbol.upper()
+    with transaction() as conn:
+        conn.execute('DELETE FROM stocks WHERE symbol = ?', (symbol,))
+        mark_changed("stocks")
+        apply_store_changes(stocks={symbol: None})
+        _close_excess_lots([(0, symbol)])
+
+# --- Portfolio Snapshot ---
+class PortfolioSnapshot(NamedTuple):
+    stocks: Dict[str, float]                                # taxable symbol -> shares
+    cash: Dict[str, float]                                  # cash account -> balance
+    retirement_accounts: List[Tuple[int, str, str, float]]  # (id, name, type, balance)
+    ira_holdings: Dict[int, List[Tuple[int, str, float]]]   # IRA account id -> [(holding id, symbol, shares)]
+    treasuries: List[Tuple[str, str, float, float, str, str]]  # rows as returned by get_treasuries_db
+
+    def iter_ira_holdings(self):
+        # Yield (account name, account type, symbol, shares) for every IRA holding
+        for acc_id, name, acc_type, _ in self.retirement_accounts:
+            for _, symbol, shares in self.ira_holdings.get(acc_id, ()):
+                yield name, acc_type, symbol.upper(), shares
+
+    def symbols(self) -> List[str]:
+        # Deduplicated taxable and IRA symbols
+        symbols = {symbol.upper() for symbol in self.stocks}
+        symbols.update(symbol for _, _, symbol, _ in self.iter_ira_holdings())
+        return sorted(symbols)
+
+@profiling.timed()
+@read_cache.cached(*PORTFOLIO_TABLES)
+def get_portfolio_snapshot() -> PortfolioSnapshot:
+    """Read every account, holding, cash balance and treasury in one pass.
+
+    The reads share one transaction, so the snapshot is consistent and costs a
+    fixed number of queries however many accounts there are.
+    """
+    with transaction(immediate=False) as conn:
+        stocks = conn.execute('SELECT symbol, shares FROM stocks').fetchall()
+        cash = conn.execute('SELECT name, balance FROM cash_accounts').fetchall()
+        accounts = conn.execute('SELECT id, name, type, balance FROM retirement_accounts').fetchall()
+        holdings = conn.execute('''
+            SELECT h.account_id, h.id, h.symbol, h.shares FROM ira_holdings h
+            JOIN retirement_accounts a ON a.id = h.account_id
+            WHERE instr(a.type, 'IRA') > 0
+            ORDER BY h.account_id, h.id
+        ''').fetchall()
+        treasuries = get_treasuries_db()
+    ira_holdings: Dict[int, List[Tuple[int, str, float]]] = {}
+    for account_id, holding_id, symbol, shares in holdings:
+        ira_holdings.setdefault(account_id, []).append((holding_id, symbol, shares))
+    return PortfolioSnapshot(
+        stocks=dict(stocks),
+        cash=dict(cash),
+        retirement_accounts=accounts,
+        ira_holdings=ira_holdings,
+        treasuries=treasuries,
+    )
@@ -0,0 +1,97 @@
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+import db
+import profiling
+
+# Net worth history. Every snapshot appends one raw row per category and
+# updates the daily, weekly and monthly rollups in the same transaction, so
+# chart queries only touch the resolution they display.
+
+RESOLUTIONS = ("daily", "weekly", "monthly")
+
+# Longest span (seconds) each resolution is used for; longer ranges use monthly
+RESOLUTION_SPANS = {
+    "raw": 2 * 24 * 3600,
+    "daily": 180 * 24 * 3600,
+    "weekly": 3 * 365 * 24 * 3600,
+}
+
+MIN_SNAPSHOT_INTERVAL = 15 * 60  # seconds between automatic snapshots
+
+def _bucket(resolution: str, day: date) -> str:
+    if resolution == "daily":
+        return day.isoformat()
+    if resolution == "weekly":
+        return (day - timedelta(days=day.weekday())).isoformat()
+    return day.replace(day=1).isoformat()
+
+@profiling.timed()
+def record_snapshot(by_category: Dict[str, float], ts: Optional[float] = None):
+    # Append a snapshot of per-category totals and roll it up
+    ts = time.time() if ts is None else ts
+    day = datetime.fromtimestamp(ts).date()
+    with db.transaction() as conn:
+        conn.executemany(
+            'INSERT INTO net_worth_snapshots (ts, category, value) VALUES (?, ?, ?)',
+            [(ts, category, value) for category, value in by_category.items()]
+        )
+        conn.executemany('''
+            INSERT INTO net_worth_rollups (resolution, bucket, category, value, samples)
+            VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT (resolution, bucket, category)
+            DO UPDATE SET value = excluded.value, samples = samples + 1
+        ''', [(resolution, _bucket(resolution, day), category, value)
+              for resolution in RESOLUTIONS for category, value in by_category.items()])
+        db.mark_changed("history")
+
+def get_last_snapshot_time() -> Optional[float]:
+    return db.get_connection().execute('SELECT MAX(ts) FROM net_worth_snapshots').fetchone()[0]
+
+@profiling.timed()
+def maybe_record_snapshot(by_category: Dict[str, float], min_interval: float = MIN_SNAPSHOT_INTERVAL) -> bool:
+    # Record a snapshot unless one was taken less than min_interval seconds ago
+    last = get_last_snapshot_time()
+    if last is not None and time.time() - last < min_interval:
+        return False
+    record_snapshot(by_category)
+    return True
+
+def pick_resolution(start: float, end: float) -> str:
+    span = end - start
+    for resolution, max_span in RESOLUTION_SPANS.items():
+        if span <= max_span:
+            return resolution
+    return "monthly"
+
+@profiling.timed()
+def get_history(start: Optional[float] = None, end: Optional[float] = None,
+                resolution: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """Per-category net worth between two unix timestamps, oldest first.
+
+    Returns {point: {category: value}} where point is an ISO timestamp for raw
+    snapshots or the bucket start date for rollups. The resolution is picked
+    from the span unless given.
+    """
+    end = time.time() if end is None else end
+    if start is None:
+        first = db.get_connection().execute('SELECT MIN(ts) FROM net_worth_snapshots').fetchone()[0]
+        start = end if first is None else first
+    resolution = resolution or pick_resolution(start, end)
+    conn = db.get_connection()
+    if resolution == "raw":
+        rows = conn.execute('''
+            SELECT ts, category, value FROM net_worth_snapshots
+            WHERE ts BETWEEN ? AND ? ORDER BY ts
+        ''', (start, end)).fetchall()
+        rows = [(datetime.fromtimestamp(ts).isoformat(timespec="seconds"), category, value) for ts, category, value in rows]
+    else:
+        rows = conn.execute('''
+            SELECT bucket, category, value FROM net_worth_rollups
+            WHERE resolution = ? AND bucket BETWEEN ? AND ? ORDER BY bucket
+        ''', (resolution, _bucket(resolution, datetime.fromtimestamp(start).date()),
+              _bucket(resolution, datetime.fromtimestamp(end).date()))).fetchall()
+    history: Dict[str, Dict[str, float]] = {}
+    for point, category, value in rows:
+        history.setdefault(point, {})[category] = value
+    return history
@@ -0,0 +1,229 @@
+import csv
+import io
+import math
+import re
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+import constants
+import db
+import profiling
+import tax_lots
+
+# Bulk import of brokerage position exports (CSV or OFX). Files are parsed as
+# a stream, rows are validated and merged per (account, symbol), and all
+# writes go through batched statements in one transaction. The in-memory
+# store is updated with the imported values on commit.
+#
+# CSV files need a header with a symbol column and a quantity column
+# ("quantity", "shares" or "units"). An optional "account" column names the
+# retirement account a row belongs to; blank, "Taxable" or "Brokerage" means
+# the taxable portfolio. Rows whose symbol is a cash account (see
+# constants.CASH_ACCOUNTS, matched case-insensitively), or whose "type"
+# column is "cash", set that cash balance from a "value"/"balance"/"amount"
+# column (or the quantity); cash rows naming any other account are errors.
+
+SYMBOL_RE = re.compile(r"^[A-Z0-9.\-^]{1,15}$")
+TAXABLE_ACCOUNT_NAMES = {"", "TAXABLE", "BROKERAGE", "PORTFOLIO"}
+MAX_ERRORS = 100
+
+IRA_UPSERTS = {
+    "replace": '''
+        INSERT INTO ira_holdings (account_id, symbol, shares) VALUES (?, ?, ?)
+        ON CONFLICT (account_id, symbol) DO UPDATE SET shares = excluded.shares
+    ''',
+    "add": '''
+        INSERT INTO ira_holdings (account_id, symbol, shares) VALUES (?, ?, ?)
+        ON CONFLICT (account_id, symbol) DO UPDATE SET shares = shares + excluded.shares
+    ''',
+}
+
+class ImportRow(NamedTuple):
+    line: int
+    account: Optional[str]      # retirement account name, None for the taxable portfolio
+    symbol: str
+    quantity: float
+    is_cash: bool = False
+
+class ImportResult(NamedTuple):
+    rows_read: int
+    stocks: int                 # taxable positions written
+    ira_holdings: int           # IRA positions written
+    cash_accounts: int          # cash balances written
+    errors: List[Tuple[int, str]]  # (line, message), capped at MAX_ERRORS
+
+# ---------------- Parsers ----------------
+def _cash_account(name: str) -> Optional[str]:
+    # The constants.CASH_ACCOUNTS key matching name in any case, if there is one
+    upper = name.upper()
+    for account in constants.CASH_ACCOUNTS:
+        if account.upper() == upper:
+            return account
+    return None
+
+def _column(header: List[str], *names: str) -> Optional[int]:
+    lowered = [h.strip().lower() for h in header]
+    for name in names:
+        if name in lowered:
+            return lowered.index(name)
+    return None
+
+def parse_csv(stream: TextIO, account: Optional[str] = None) -> Iterator[ImportRow]:
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    symbol_col = _column(header, "symbol", "ticker")
+    quantity_col = _column(header, "quantity", "shares", "units")
+    account_col = _column(header, "account", "account name")
+    type_col = _column(header, "type", "asset type")
+    value_col = _column(header, "value", "balance", "amount", "market value")
+    if symbol_col is None or (quantity_col is None and value_col is None):
+        raise ValueError("CSV header needs a symbol column and a quantity or value column")
+    for line, record in enumerate(reader, start=2):
+        if not record or not any(field.strip() for field in record):
+            continue
+        def field(col):
+            return record[col].strip() if col is not None and col < len(record) else ""
+        cash_account = _cash_account(field(symbol_col))
+        symbol = cash_account or field(symbol_col).upper()
+        row_account = field(account_col) or account
+        is_cash = cash_account is not None or field(type_col).lower() == "cash"
+        raw = field(value_col) if is_cash and field(value_col) else field(quantity_col)
+        yield ImportRow(line, row_account, symbol, _to_float(raw), is_cash)
+
+_OFX_TAG_RE = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+def _ofx_tokens(stream: TextIO, chunk_size: int = 1 << 16) -> Iterator[Tuple[bool, str, str]]:
+    # (closing, TAG, text) for every tag, read in chunks; works for SGML and XML OFX
+    buffer = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        buffer += chunk
+        cut = buffer.rfind("<") if chunk else len(buffer)
+        for match in _OFX_TAG_RE.finditer(buffer, 0, cut):
+            yield match.group(1) == "/", match.group(2).upper(), match.group(3).strip()
+        buffer = buffer[cut:]
+        if not chunk:
+            return
+
+def parse_ofx(stream: TextIO, account: Optional[str] = None) -> Iterator[ImportRow]:
+    """Positions from an OFX investment statement.
+
+    Positions reference securities by CUSIP/ID and the tickers only appear in
+    the trailing SECLIST, so units are accumulated per security id while
+    streaming and resolved to tickers at the end.
+    """
+    units: Dict[str, float] = {}
+    tickers: Dict[str, str] = {}
+    in_position = in_secinfo = False
+    security_id = None
+    for closing, tag, text in _ofx_tokens(stream):
+        if tag in ("POSSTOCK", "POSMF", "POSDEBT", "POSOTHER", "POSOPT"):
+            in_position = not closing
+            security_id = None
+        elif tag == "SECINFO":
+            in_secinfo = not closing
+            security_id = None
+        elif tag == "UNIQUEID" and not closing:
+            security_id = text
+        elif tag == "UNITS" and in_position and security_id and not closing:
+            units[security_id] = units.get(security_id, 0.0) + _to_float(text)
+        elif tag == "TICKER" and in_secinfo and security_id and not closing:
+            tickers[security_id] = text.upper()
+    for security_id, quantity in units.items():
+        symbol = tickers.get(security_id, security_id)
+        cash_account = _cash_account(symbol)
+        yield ImportRow(0, account, cash_account or symbol, quantity, cash_account is not None)
+
+def _to_float(raw: str) -> float:
+    try:
+        return float(raw.replace(",", "").replace("$", "")) if raw else math.nan
+    except ValueError:
+        return math.nan
+
+# ---------------- Import ----------------
+@profiling.timed()
+def import_positions(rows: Iterable[ImportRow], mode: str = "replace") -> ImportResult:
+    """Validate, merge and write parsed rows in a single transaction.
+
+    mode="replace" sets each imported position to the file's quantity (a
+    statement of holdings); mode="add" adds the quantities to what is held.
+    Invalid rows are reported in ImportResult.errors and skipped.
+    """
+    if mode not in ("replace", "add"):
+        raise ValueError(f"Unknown import mode: {mode}")
+    errors: List[Tuple[int, str]] = []
+    def error(line: int, message: str):
+        if len(errors) < MAX_ERRORS:
+            errors.append((line, message))
+
+    accounts = {name.upper(): (acc_id, acc_type) for acc_id, name, acc_type, _ in db.get_retirement_accounts()}
+    stocks: Dict[str, float] = {}
+    holdings: Dict[Tuple[int, str], float] = {}
+    cash: Dict[str, float] = {}
+    rows_read = 0
+    for row in rows:
+        rows_read += 1
+        # Cash account names keep their own case (e.g. "Checking")
+        if not SYMBOL_RE.match(row.symbol.upper()):
+            error(row.line, f"invalid symbol {row.symbol!r}")
+            continue
+        if not math.isfinite(row.quantity) or row.quantity < 0:
+            error(row.line, f"invalid quantity for {row.symbol}")
+            continue
+        if row.is_cash:
+            # Only the app's cash accounts are shown (and can be edited)
+            if row.symbol not in constants.CASH_ACCOUNTS:
+                error(row.line, f"unknown cash account {row.symbol!r} (expected one of {', '.join(constants.CASH_ACCOUNTS)})")
+                continue
+            cash[row.symbol] = cash.get(row.symbol, 0.0) + row.quantity
+            continue
+        account = (row.account or "").strip()
+        if account.upper() in TAXABLE_ACCOUNT_NAMES:
+            stocks[row.symbol] = stocks.get(row.symbol, 0.0) + row.quantity
+            continue
+        match = accounts.get(account.upper())
+        if match is None:
+            error(row.line, f"unknown retirement account {account!r}")
+        elif "IRA" not in match[1]:
+            error(row.line, f"{account!r} is a {match[1]} account and cannot hold equities")
+        else:
+            key = (match[0], row.symbol)
+            holdings[key] = holdings.get(key, 0.0) + row.quantity
+
+    with db.transaction() as conn:
+        if stocks:
+            if mode == "add":
+                existing = dict(conn.execute('SELECT symbol, shares FROM stocks').fetchall())
+                stocks = {symbol: existing.get(symbol, 0.0) + qty for symbol, qty in stocks.items()}
+            conn.executemany('''
+                INSERT INTO stocks (symbol, shares) VALUES (?, ?)
+                ON CONFLICT (symbol) DO UPDATE SET shares = excluded.shares
+            ''', list(stocks.items()))
+            db.mark_changed("stocks")
+            db.apply_store_changes(stocks=stocks)
+        if holdings:
+            # One row per (account, symbol) (see migrations._unique_ira_holdings)
+            conn.executemany(IRA_UPSERTS[mode], [(account_id, symbol, qty) for (account_id, symbol), qty in holdings.items()])
+            db.mark_changed("ira_holdings")
+        if cash:
+            if mode == "add":
+                current = dict(conn.execute('SELECT name, balance FROM cash_accounts').fetchall())
+                cash = {name: current.get(name, 0.0) + balance for name, balance in cash.items()}
+            conn.executemany('INSERT OR REPLACE INTO cash_accounts (name, balance) VALUES (?, ?)', list(cash.items()))
+            db.mark_changed("cash_accounts")
+            db.apply_store_changes(cash=cash)
+        if mode == "replace":
+            # Lower quantities close tax lots, as when a holding is edited
+            tax_lots.close_excess_lots([(tax_lots.TAXABLE, symbol) for symbol in stocks] + list(holdings))
+
+    return ImportResult(rows_read, len(stocks), len(holdings), len(cash), errors)
+
+def import_file(stream, filename: str, account: Optional[str] = None, mode: str = "replace") -> ImportResult:
+    # Import a CSV or OFX/QFX file (text or binary stream), picking the parser from its extension
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="")
+    if filename.lower().endswith((".ofx", ".qfx")):
+        rows = parse_ofx(stream, account)
+    else:
+        rows = parse_csv(stream, account)
+    return import_positions(rows, mode)
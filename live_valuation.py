@@ -0,0 +1,346 @@
+import socket
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import numpy as np
+import constants
+import data_fetcher
+import db
+import valuation
+
+# Streaming valuation: net worth and category totals kept current from a
+# price tick stream without revaluing the portfolio.
+#
+# Each database's LiveValuation holds an exposure index, symbol -> shares per
+# net worth category across the taxable portfolio and every IRA, built once
+# from valuation.current_valuation(). A tick then moves the totals by
+# shares * (new price - last price): a dict lookup and a couple of additions,
+# whatever the size of the portfolio. The index is rebuilt (at the live
+# prices) only after a write to the portfolio's tables.
+#
+# Ticks come from a feed: the mock market simulator, polling the live quote
+# provider, or newline-delimited "SYMBOL PRICE" lines on a TCP socket (run
+# `python live_valuation.py --serve 9009` for a local simulated one).
+
+class Tick(NamedTuple):
+    symbol: str
+    price: float
+
+class LiveTotals(NamedTuple):
+    net_worth: float                # including constants.CASH, as on the Dashboard
+    by_category: Dict[str, float]
+    ticks: int                      # ticks applied since the index was built
+    as_of: Optional[float]          # unix timestamp of the last tick applied
+
+TickBatches = Iterator[List[Tick]]
+
+class LiveValuation:
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._exposure: Dict[str, Tuple[float, List[Tuple[int, float]]]] = {}  # symbol -> (total shares, [(category, shares)])
+        self._prices: Dict[str, float] = {}
+        self._by_category: List[float] = [0.0] * len(valuation.CATEGORIES)
+        self._net_worth = 0.0
+        self._ticks = 0
+        self._as_of: Optional[float] = None
+
+    def rebuild(self):
+        # Rebuild the exposure index and totals from the database, at the
+        # latest live prices (cached quotes for symbols without a tick yet).
+        # Cleared before reading, so a write landing during the read marks
+        # the new index stale again instead of being lost
+        self._dirty = False
+        with db.use_database(self.db_file):
+            _, positions, _ = valuation.current_valuation()
+        with self._lock:
+            prices = dict(constants.STOCK_PRICES)
+            prices.update(self._prices)
+            values = valuation.value_positions(positions, valuation.price_vector(positions, prices))
+            n_categories = len(valuation.CATEGORIES)
+            categories = positions.account_categories[positions.account_ids]
+            # Shares per (symbol, category) in one pass
+            keys = positions.symbol_ids * n_categories + categories
+            shares = np.bincount(keys, positions.shares, minlength=len(positions.symbols) * n_categories)
+            shares = shares.reshape(len(positions.symbols), n_categories)
+            exposure = {}
+            for symbol_id, symbol in enumerate(positions.symbols):
+                row = shares[symbol_id]
+                held = [(int(c), float(row[c])) for c in np.flatnonzero(row)]
+                if held:
+                    exposure[symbol] = (float(row.sum()), held)
+            self._exposure = exposure
+            self._prices = {symbol: prices.get(symbol, 0.0) for symbol in exposure}
+            self._by_category = [values.by_category[name] for name in valuation.CATEGORIES]
+            self._net_worth = values.net_worth + constants.CASH
+            self._ticks = 0
+
+    def invalidate(self):
+        self._dirty = True
+
+    def apply(self, ticks: Iterable[Tick]) -> int:
+        """Apply ticks in order; returns how many moved a held symbol.
+
+        Each tick costs O(1): the totals move by the symbol's shares times
+        the price change.
+        """
+        if self._dirty:
+            self.rebuild()
+        applied = 0
+        with self._lock:
+            exposure, prices, by_category = self._exposure, self._prices, self._by_category
+            net_worth = self._net_worth
+            for symbol, price in ticks:
+                entry = exposure.get(symbol)
+                if entry is None:
+                    continue
+                change = price - prices[symbol]
+                prices[symbol] = price
+                total, held = entry
+                net_worth += total * change
+                for category, shares in held:
+                    by_category[category] += shares * change
+                applied += 1
+            self._net_worth = net_worth
+            self._ticks += applied
+            if applied:
+                self._as_of = time.time()
+        return applied
+
+    def symbols(self) -> List[str]:
+        if self._dirty:
+            self.rebuild()
+        return list(self._exposure)
+
+    def totals(self) -> LiveTotals:
+        if self._dirty:
+            self.rebuild()
+        with self._lock:
+            return LiveTotals(self._net_worth, dict(zip(valuation.CATEGORIES, self._by_category)),
+                              self._ticks, self._as_of)
+
+# --- Registry ---
+_trackers: Dict[str, LiveValuation] = {}
+_trackers_lock = threading.Lock()
+
+def get_tracker(db_file: Optional[str] = None) -> LiveValuation:
+    # The live valuation of db_file (default: db.current_db()), created on first use
+    db_file = db_file or db.current_db()
+    tracker = _trackers.get(db_file)
+    if tracker is None:
+        with _trackers_lock:
+            tracker = _trackers.setdefault(db_file, LiveValuation(db_file))
+    return tracker
+
+@db.subscribe
+def _invalidate_on_write(event: db.ChangeEvent):
+    tracker = _trackers.get(event.db_file)
+    if tracker is not None and event.names & set(db.PORTFOLIO_TABLES):
+        tracker.invalidate()
+
+# ---------------- Tick Sources ----------------
+def simulated_ticks(symbols: Optional[Callable[[], List[str]]] = None, market=None,
+                    steps: int = 1, interval: float = 0.0) -> TickBatches:
+    """Ticks from the mock market simulator (default data_fetcher.get_mock_market()).
+
+    Each batch is one simulator step for every symbol returned by symbols()
+    (default: every symbol held in an open live valuation), every interval
+    seconds.
+    """
+    market = market or data_fetcher.get_mock_market()
+    symbols = symbols or tracked_symbols
+    while True:
+        wanted = symbols()
+        market.add_symbols(wanted)
+        index = {symbol: i for i, symbol in enumerate(market.symbols)}
+        wanted = [symbol for symbol in wanted if symbol in index]
+        columns = [index[symbol] for symbol in wanted]
+        for row in market.advance(steps)[:, columns]:
+            yield [Tick(symbol, price) for symbol, price in zip(wanted, row.tolist())]
+        if interval:
+            time.sleep(interval)
+
+def polled_ticks(symbols: Optional[Callable[[], List[str]]] = None, provider=None,
+                 interval: float = 15.0) -> TickBatches:
+    # Poll a quote provider (default: the live one) and yield the prices that
+    # changed, every poll (an empty batch when none did)
+    provider = provider or data_fetcher.get_quote_provider()[0]
+    symbols = symbols or tracked_symbols
+    last: Dict[str, float] = {}
+    while True:
+        wanted = symbols()
+        quotes = provider(wanted, data_fetcher.REQUEST_TIMEOUT) if wanted else {}
+        changed = [Tick(symbol, float(price)) for symbol, price in quotes.items() if last.get(symbol) != price]
+        last.update(quotes)
+        yield changed
+        time.sleep(interval)
+
+def socket_ticks(host: str, port: int) -> TickBatches:
+    """Ticks read from "SYMBOL PRICE" (or "SYMBOL,PRICE") lines on a TCP socket.
+
+    The complete lines of each read are yielded as one batch; malformed lines
+    are skipped. Ends when the server closes the connection.
+    """
+    with socket.create_connection((host, port)) as conn:
+        pending = b""
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break
+            *lines, pending = (pending + data).split(b"\n")
+            batch = []
+            for line in lines:
+                parts = line.decode(errors="replace").replace(",", " ").split()
+                if len(parts) == 2:
+                    try:
+                        batch.append(Tick(parts[0].upper(), float(parts[1])))
+                    except ValueError:
+                        pass
+            if batch:
+                yield batch
+
+def tracked_symbols() -> List[str]:
+    # Symbols held in any database with a live valuation
+    symbols = set()
+    for tracker in list(_trackers.values()):
+        symbols.update(tracker.symbols())
+    return sorted(symbols)
+
+# ---------------- Feed ----------------
+# One process-wide feed thread applies every tick batch to each live
+# valuation. It runs while someone holds it: start_feed(holder=...) takes or
+# renews a hold, release_feed drops it, and holds not renewed for FEED_LEASE
+# seconds lapse (a closed browser tab never releases). With no holds left
+# the thread stops after its current batch.
+FEED_LEASE = 30.0
+class FeedStatus(NamedTuple):
+    running: bool
+    source: Optional[str]
+    batches: int
+    ticks: int
+    started: Optional[float]
+    last_error: Optional[str]
+
+_feed_lock = threading.Lock()
+_feed_stop = threading.Event()
+_feed_thread: Optional[threading.Thread] = None
+_feed_status = FeedStatus(False, None, 0, 0, None, None)
+_feed_holders: Dict[str, float] = {}  # holder -> time of its last renewal
+
+def make_source(source: Optional[str] = None) -> TickBatches:
+    """Tick batches from a named source.
+
+    "mock" (the market simulator, one step a second), "poll" (the quote
+    provider every 15 s) or "socket:host:port". The default is "mock" when
+    data_fetcher.USE_MOCK is set, else "poll".
+    """
+    source = source or ("mock" if data_fetcher.USE_MOCK else "poll")
+    if source == "mock":
+        return simulated_ticks(interval=1.0)
+    if source == "poll":
+        return polled_ticks()
+    if source.startswith("socket:"):
+        _, host, port = source.split(":")
+        return socket_ticks(host, int(port))
+    raise ValueError(f"Unknown tick source: {source}")
+
+def _run_feed(source: str, batches: TickBatches):
+    global _feed_status
+    try:
+        for batch in batches:
+            if _feed_stop.is_set() or not _feed_held():
+                break
+            if not batch:
+                continue
+            for tracker in list(_trackers.values()):
+                tracker.apply(batch)
+            with _feed_lock:
+                _feed_status = _feed_status._replace(batches=_feed_status.batches + 1,
+                                                     ticks=_feed_status.ticks + len(batch))
+    except Exception as e:
+        print(f"Live price feed {source} failed: {e}")
+        with _feed_lock:
+            _feed_status = _feed_status._replace(last_error=str(e))
+    finally:
+        with _feed_lock:
+            _feed_status = _feed_status._replace(running=False)
+        db.close_connections()
+
+def _feed_held() -> bool:
+    # Drop lapsed holds; True while any remain
+    now = time.time()
+    with _feed_lock:
+        for holder, renewed in list(_feed_holders.items()):
+            if now - renewed > FEED_LEASE:
+                del _feed_holders[holder]
+        return bool(_feed_holders)
+
+def start_feed(source: Optional[str] = None, holder: str = "default") -> bool:
+    """Hold the feed for holder, starting the thread unless it is already running.
+
+    Safe to call on every render, which also renews the hold; returns True
+    only for the call that started the thread.
+    """
+    global _feed_thread, _feed_status
+    with _feed_lock:
+        _feed_holders[holder] = time.time()
+        if _feed_thread is not None and _feed_thread.is_alive():
+            return False
+        source = source or ("mock" if data_fetcher.USE_MOCK else "poll")
+        batches = make_source(source)
+        _feed_stop.clear()
+        _feed_status = FeedStatus(True, source, 0, 0, time.time(), None)
+        _feed_thread = threading.Thread(target=_run_feed, args=(source, batches), name="live-feed", daemon=True)
+        _feed_thread.start()
+        return True
+
+def release_feed(holder: str = "default"):
+    # Drop holder's hold; the feed stops after its current batch once no one holds it
+    with _feed_lock:
+        _feed_holders.pop(holder, None)
+        if not _feed_holders:
+            _feed_stop.set()
+
+def stop_feed(timeout: Optional[float] = None):
+    # Stops after the current batch (a blocked socket read ends when the server sends or closes)
+    global _feed_thread
+    with _feed_lock:
+        _feed_holders.clear()
+    _feed_stop.set()
+    if _feed_thread is not None:
+        _feed_thread.join(timeout)
+    _feed_thread = None
+
+def feed_status() -> FeedStatus:
+    return _feed_status
+
+# ---------------- Local Socket Stand-in ----------------
+def serve_simulated_ticks(port: int, host: str = "127.0.0.1", symbols: Optional[List[str]] = None,
+                          steps_per_second: float = 10.0):
+    # Serve mock market ticks as "SYMBOL PRICE" lines to each client that connects
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            wanted = symbols or list(data_fetcher.MOCK_BASE_PRICES)
+            for batch in simulated_ticks(lambda: wanted, interval=1 / steps_per_second):
+                try:
+                    self.wfile.write("".join(f"{tick.symbol} {tick.price:.4f}\n" for tick in batch).encode())
+                except OSError:
+                    return
+
+    with socketserver.ThreadingTCPServer((host, port), Handler) as server:
+        server.daemon_threads = True
+        print(f"Serving simulated ticks on {host}:{port}")
+        server.serve_forever()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve simulated price ticks on a local socket.")
+    parser.add_argument("--serve", type=int, required=True, metavar="PORT")
+    parser.add_argument("--symbols", help="comma separated (default: the mock base price symbols)")
+    parser.add_argument("--rate", type=float, default=10.0, help="simulator steps per second")
+    args = parser.parse_args()
+    serve_simulated_ticks(args.serve, symbols=args.symbols.split(",") if args.symbols else None,
+                          steps_per_second=args.rate)
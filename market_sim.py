@@ -0,0 +1,168 @@
+import threading
+import zlib
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+import numpy as np
+
+# Seeded market simulator for mock prices, benchmarks and load tests.
+#
+# Prices follow correlated geometric Brownian motion: every symbol loads on
+# one market factor with the same pairwise correlation, plus its own noise,
+# so a tick for the whole universe is one batch of normal draws whatever its
+# size. Each symbol's volatility is derived from its name, so it doesn't
+# depend on which other symbols are simulated. The same seed and the same
+# sequence of calls give the same prices, and a recorded session can be
+# saved and replayed exactly (see ReplayMarket).
+
+TRADING_MINUTES_PER_YEAR = 252 * 390
+
+DEFAULT_DRIFT = 0.07
+DEFAULT_CORRELATION = 0.3
+DEFAULT_DT = 1 / TRADING_MINUTES_PER_YEAR  # one tick = one trading minute
+DEFAULT_PRICE = 100.0
+
+def symbol_volatility(symbol: str) -> float:
+    # Annualized volatility between 15% and 45%, fixed per symbol
+    return 0.15 + 0.30 * (zlib.crc32(symbol.upper().encode()) % 1000) / 1000
+
+class MarketSimulator:
+    def __init__(self, seed: int = 0, base_prices: Optional[Mapping[str, float]] = None,
+                 drift: float = DEFAULT_DRIFT, correlation: float = DEFAULT_CORRELATION,
+                 dt: float = DEFAULT_DT, record: bool = False):
+        self.seed = seed
+        self.drift = drift
+        self.correlation = correlation
+        self.dt = dt
+        self._base_prices = {symbol.upper(): float(price) for symbol, price in (base_prices or {}).items()}
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        self._prices = np.zeros(0)
+        self._volatility = np.zeros(0)
+        self.tick = 0
+        # Recorded blocks: (ticks, prices of the symbols known then, one row per tick)
+        self._frames: Optional[List[Tuple[np.ndarray, np.ndarray]]] = [] if record else None
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self._symbols)
+
+    def _add(self, symbols: Iterable[str]):
+        # Register new symbols at their base price (caller holds the lock)
+        new = [s for s in dict.fromkeys(symbol.upper() for symbol in symbols) if s not in self._index]
+        if not new:
+            return
+        for symbol in new:
+            self._index[symbol] = len(self._symbols)
+            self._symbols.append(symbol)
+        self._prices = np.concatenate([self._prices, [self._base_prices.get(s, DEFAULT_PRICE) for s in new]])
+        self._volatility = np.concatenate([self._volatility, [symbol_volatility(s) for s in new]])
+        if self._frames is not None:
+            self._frames.append((np.array([self.tick]), self._prices[None].copy()))
+
+    def add_symbols(self, symbols: Iterable[str]):
+        with self._lock:
+            self._add(symbols)
+
+    def _log_returns(self, steps: int) -> np.ndarray:
+        # (steps, symbols) log returns for the next steps ticks
+        n = len(self._symbols)
+        draws = self._rng.standard_normal((steps, n + 1))
+        shocks = np.sqrt(self.correlation) * draws[:, :1] + np.sqrt(1 - self.correlation) * draws[:, 1:]
+        sigma = self._volatility
+        return (self.drift - 0.5 * sigma ** 2) * self.dt + sigma * np.sqrt(self.dt) * shocks
+
+    def advance(self, steps: int = 1, symbols: Iterable[str] = ()) -> np.ndarray:
+        """Move the whole universe (plus any new symbols) forward steps ticks.
+
+        Returns the (steps, symbols) price path, in the order of self.symbols.
+        """
+        with self._lock:
+            self._add(symbols)
+            path = self._prices * np.exp(np.cumsum(self._log_returns(steps), axis=0))
+            if steps:
+                self._prices = path[-1].copy()
+            if self._frames is not None:
+                self._frames.append((np.arange(self.tick + 1, self.tick + steps + 1), path))
+            self.tick += steps
+            return path
+
+    def stream(self, batch: int = 1_000, symbols: Iterable[str] = ()) -> Iterator[np.ndarray]:
+        # Endless tick stream, generated batch ticks at a time
+        self.add_symbols(symbols)
+        while True:
+            yield self.advance(batch)
+
+    def quotes(self, symbols: Iterable[str]) -> Dict[str, float]:
+        # Current prices (unknown symbols join the universe at their base price)
+        with self._lock:
+            symbols = [symbol.upper() for symbol in symbols]
+            self._add(symbols)
+            prices = np.round(self._prices[[self._index[s] for s in symbols]], 2)
+            return dict(zip(symbols, prices.tolist()))
+
+    def save(self, path: str):
+        """Write the recorded session to an .npz file for ReplayMarket."""
+        if self._frames is None:
+            raise ValueError("This simulator was not created with record=True")
+        with self._lock:
+            width = len(self._symbols)
+            prices = np.vstack([np.pad(block, ((0, 0), (0, width - block.shape[1])), constant_values=np.nan)
+                                for _, block in self._frames]) if self._frames else np.zeros((0, width))
+            ticks = np.concatenate([ticks for ticks, _ in self._frames]) if self._frames else np.zeros(0, np.int64)
+            np.savez_compressed(path, symbols=np.array(self._symbols), ticks=ticks, prices=prices, seed=self.seed)
+
+def simulate_paths(symbols: List[str], steps: int, seed: int = 0,
+                   base_prices: Optional[Mapping[str, float]] = None, **params) -> np.ndarray:
+    # (steps + 1, symbols) price paths from a fresh simulator, starting prices first
+    market = MarketSimulator(seed, base_prices, **params)
+    market.add_symbols(symbols)
+    start = market._prices.copy()
+    return np.vstack([start, market.advance(steps)])
+
+class ReplayMarket:
+    """Plays back a session saved by MarketSimulator.save through the same interface.
+
+    advance(steps) moves steps ticks through the recording (stopping at its
+    end); symbols that were not recorded have no quote.
+    """
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            self._symbols = [str(s) for s in data["symbols"]]
+            self._ticks = data["ticks"]
+            self._prices = data["prices"]
+        self._index = {symbol: i for i, symbol in enumerate(self._symbols)}
+        self._lock = threading.Lock()
+        # Start on the last frame recorded at the first tick
+        self._frame = max(int(np.searchsorted(self._ticks, self._ticks[0], "right")) - 1, 0) if len(self._ticks) else 0
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self._symbols)
+
+    @property
+    def tick(self) -> int:
+        return int(self._ticks[self._frame]) if len(self._ticks) else 0
+
+    def add_symbols(self, symbols: Iterable[str]):
+        pass
+
+    def advance(self, steps: int = 1, symbols: Iterable[str] = ()) -> np.ndarray:
+        # Returns the recorded prices of the ticks passed
+        with self._lock:
+            if not len(self._ticks):
+                return np.zeros((0, len(self._symbols)))
+            start = self._frame
+            target = self._ticks[start] + steps
+            self._frame = max(int(np.searchsorted(self._ticks, target, "right")) - 1, start)
+            return self._prices[start + 1:self._frame + 1]
+
+    def quotes(self, symbols: Iterable[str]) -> Dict[str, float]:
+        with self._lock:
+            frame = self._prices[self._frame] if len(self._prices) else np.zeros(0)
+        quotes = {}
+        for symbol in symbols:
+            i = self._index.get(symbol.upper())
+            if i is not None and not np.isnan(frame[i]):
+                quotes[symbol.upper()] = round(float(frame[i]), 2)
+        return quotes
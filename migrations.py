@@ -0,0 +1,217 @@
+import sqlite3
+from typing import Callable, List
+
+# Schema migrations, applied in order by migrate(). PRAGMA user_version holds
+# the number of migrations a database has had, so each one runs exactly once
+# per file. Append new migrations to the end of MIGRATIONS; never edit or
+# reorder ones that have shipped.
+
+def _create_tables(conn: sqlite3.Connection):
+    # 1: the original schema. IF NOT EXISTS, so files created before
+    # versioning are adopted as they are.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cash_accounts (
+            name TEXT PRIMARY KEY,
+            balance REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stocks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT NOT NULL,
+            shares REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS retirement_accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL, -- e.g., IRA, 401k, etc.
+            balance REAL DEFAULT 0.0
+        )
+    ''')
+    # Equities inside IRA accounts
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ira_holdings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            shares REAL NOT NULL,
+            FOREIGN KEY(account_id) REFERENCES retirement_accounts(id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS treasuries (
+            name TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            face_value REAL NOT NULL,
+            interest_rate REAL NOT NULL,
+            purchase_date TEXT NOT NULL,
+            maturity_date TEXT NOT NULL
+        )
+    ''')
+    # Persistent price cache (see quote_cache.py)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS quotes (
+            symbol TEXT PRIMARY KEY,
+            price REAL NOT NULL,
+            as_of REAL NOT NULL, -- unix timestamp of the fetch
+            source TEXT NOT NULL
+        )
+    ''')
+    # Net worth history (see history.py): append-only raw snapshots plus
+    # daily/weekly/monthly rollups kept up to date on insert
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS net_worth_snapshots (
+            ts REAL NOT NULL, -- unix timestamp
+            category TEXT NOT NULL,
+            value REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_net_worth_snapshots_ts ON net_worth_snapshots (ts)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS net_worth_rollups (
+            resolution TEXT NOT NULL, -- daily, weekly or monthly
+            bucket TEXT NOT NULL, -- ISO date the bucket starts on
+            category TEXT NOT NULL,
+            value REAL NOT NULL, -- last value recorded in the bucket
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (resolution, bucket, category)
+        ) WITHOUT ROWID
+    ''')
+
+def _unique_stock_symbols(conn: sqlite3.Connection):
+    # 2: one row per (upper-cased) stock symbol, enforced by a unique index so
+    # lookups by symbol are indexed and add_stock can UPSERT
+    duplicates = conn.execute('''
+        SELECT UPPER(symbol), MIN(id), SUM(shares) FROM stocks
+        GROUP BY UPPER(symbol) HAVING COUNT(*) > 1 OR MIN(symbol) != UPPER(symbol)
+    ''').fetchall()
+    for symbol, keep_id, shares in duplicates:
+        conn.execute('DELETE FROM stocks WHERE UPPER(symbol) = ? AND id != ?', (symbol, keep_id))
+        conn.execute('UPDATE stocks SET symbol = ?, shares = ? WHERE id = ?', (symbol, shares, keep_id))
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_stocks_symbol ON stocks (symbol)')
+
+def _index_ira_holdings(conn: sqlite3.Connection):
+    # 3: holdings are read per account, and deleting an account cascades to
+    # them; both need an index on account_id. Holdings orphaned before
+    # foreign keys were enforced are dropped first.
+    conn.execute('DELETE FROM ira_holdings WHERE account_id NOT IN (SELECT id FROM retirement_accounts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ira_holdings_account ON ira_holdings (account_id, symbol)')
+
+def _tax_lots(conn: sqlite3.Connection):
+    # 4: tax lots (see tax_lots.py). account_id 0 is the taxable portfolio,
+    # anything else a retirement account. lot_positions and lot_symbols are
+    # per-(account, symbol) and per-symbol aggregates of the open lots, kept
+    # current by the triggers below so readers never re-sum the lots.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id INTEGER NOT NULL DEFAULT 0,
+            symbol TEXT NOT NULL,
+            acquired TEXT NOT NULL, -- ISO date
+            quantity REAL NOT NULL, -- shares still held
+            unit_cost REAL NOT NULL -- cost basis per share
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_lots_position ON lots (account_id, symbol, acquired)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS disposals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            lot_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            acquired TEXT NOT NULL,
+            disposed TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            unit_cost REAL NOT NULL,
+            unit_proceeds REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lot_positions (
+            account_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            cost REAL NOT NULL,
+            lots INTEGER NOT NULL,
+            PRIMARY KEY (account_id, symbol)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lot_symbols (
+            symbol TEXT PRIMARY KEY,
+            quantity REAL NOT NULL,
+            cost REAL NOT NULL,
+            lots INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    # Each trigger adds the new lot's row to the aggregates and/or takes the
+    # old one out; emptied aggregate rows are dropped
+    add_new = '''
+        INSERT INTO lot_positions (account_id, symbol, quantity, cost, lots)
+        VALUES (new.account_id, new.symbol, new.quantity, new.quantity * new.unit_cost, 1)
+        ON CONFLICT (account_id, symbol) DO UPDATE SET
+            quantity = quantity + excluded.quantity, cost = cost + excluded.cost, lots = lots + 1;
+        INSERT INTO lot_symbols (symbol, quantity, cost, lots)
+        VALUES (new.symbol, new.quantity, new.quantity * new.unit_cost, 1)
+        ON CONFLICT (symbol) DO UPDATE SET
+            quantity = quantity + excluded.quantity, cost = cost + excluded.cost, lots = lots + 1;
+    '''
+    remove_old = '''
+        UPDATE lot_positions SET quantity = quantity - old.quantity, cost = cost - old.quantity * old.unit_cost,
+            lots = lots - 1 WHERE account_id = old.account_id AND symbol = old.symbol;
+        DELETE FROM lot_positions WHERE account_id = old.account_id AND symbol = old.symbol AND lots = 0;
+        UPDATE lot_symbols SET quantity = quantity - old.quantity, cost = cost - old.quantity * old.unit_cost,
+            lots = lots - 1 WHERE symbol = old.symbol;
+        DELETE FROM lot_symbols WHERE symbol = old.symbol AND lots = 0;
+    '''
+    conn.execute(f'CREATE TRIGGER IF NOT EXISTS lots_insert AFTER INSERT ON lots BEGIN {add_new} END')
+    conn.execute(f'CREATE TRIGGER IF NOT EXISTS lots_delete AFTER DELETE ON lots BEGIN {remove_old} END')
+    conn.execute(f'CREATE TRIGGER IF NOT EXISTS lots_update AFTER UPDATE ON lots BEGIN {remove_old} {add_new} END')
+    # Lots go with their retirement account
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS retirement_accounts_delete_lots AFTER DELETE ON retirement_accounts
+        BEGIN DELETE FROM lots WHERE account_id = old.id; END
+    ''')
+
+def _unique_ira_holdings(conn: sqlite3.Connection):
+    # 5: one row per (account, upper-cased symbol) in ira_holdings, as for
+    # stocks in 2, so add_ira_holding can UPSERT. Duplicates are merged into
+    # the oldest row; the unique index replaces the plain one from 3.
+    duplicates = conn.execute('''
+        SELECT account_id, UPPER(symbol), MIN(id), SUM(shares) FROM ira_holdings
+        GROUP BY account_id, UPPER(symbol) HAVING COUNT(*) > 1 OR MIN(symbol) != UPPER(symbol)
+    ''').fetchall()
+    for account_id, symbol, keep_id, shares in duplicates:
+        conn.execute('DELETE FROM ira_holdings WHERE account_id = ? AND UPPER(symbol) = ? AND id != ?',
+                     (account_id, symbol, keep_id))
+        conn.execute('UPDATE ira_holdings SET symbol = ?, shares = ? WHERE id = ?', (symbol, shares, keep_id))
+    conn.execute('DROP INDEX IF EXISTS idx_ira_holdings_account')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_ira_holdings_position ON ira_holdings (account_id, symbol)')
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _create_tables,
+    _unique_stock_symbols,
+    _index_ira_holdings,
+    _tax_lots,
+    _unique_ira_holdings,
+]
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply every migration the database has not had yet; returns how many ran.
+
+    Run inside a transaction: PRAGMA user_version is transactional, so a
+    failed migration leaves both the schema and the version untouched.
+    """
+    version = schema_version(conn)
+    if version > len(MIGRATIONS):
+        print(f"Database schema version {version} is newer than this app ({len(MIGRATIONS)})")
+        return 0
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(conn)
+        conn.execute(f'PRAGMA user_version = {number}')
+    return len(MIGRATIONS) - version
@@ -0,0 +1,173 @@
+import os
+import re
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import constants
+
+# Local daily OHLCV store. Each symbol gets a directory of append-only column
+# files (dates as int64 days since the epoch, prices and volume as float64)
+# that are read back through np.memmap, so range queries only page in the rows
+# they touch and new bars are appended without rewriting history.
+
+COLUMNS = {
+    "date": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.float64,
+}
+
+# A history provider takes symbols and a [start, end) date range and returns
+# {symbol: {column: array}} with "date" as datetime64[D]; symbols without new
+# bars may be left out.
+HistoryProvider = Callable[[List[str], date, date], Dict[str, Dict[str, np.ndarray]]]
+
+def _symbol_dir(symbol: str) -> str:
+    return os.path.join(constants.PRICE_HISTORY_DIR, re.sub(r"[^A-Za-z0-9.-]", "_", symbol.upper()))
+
+def _open_column(symbol: str, column: str) -> np.ndarray:
+    path = os.path.join(_symbol_dir(symbol), f"{column}.bin")
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=COLUMNS[column])
+    return np.memmap(path, dtype=COLUMNS[column], mode="r")
+
+def _length(symbol: str) -> int:
+    # Rows present in every column (guards against a partially written append)
+    sizes = []
+    for column, dtype in COLUMNS.items():
+        path = os.path.join(_symbol_dir(symbol), f"{column}.bin")
+        sizes.append(os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0)
+    return min(sizes)
+
+def last_date(symbol: str) -> Optional[date]:
+    n = _length(symbol)
+    if n == 0:
+        return None
+    return np.datetime64(int(_open_column(symbol, "date")[n - 1]), "D").astype(date)
+
+def checked_through(symbol: str) -> Optional[date]:
+    # Last day a fetch for a symbol without stored bars came back empty
+    # (delisted, mistyped, a cash ticker), so ingest doesn't ask again from
+    # PRICE_HISTORY_START every time
+    try:
+        with open(os.path.join(_symbol_dir(symbol), "checked")) as f:
+            return date.fromisoformat(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def _mark_checked(symbol: str, through: date):
+    os.makedirs(_symbol_dir(symbol), exist_ok=True)
+    with open(os.path.join(_symbol_dir(symbol), "checked"), "w") as f:
+        f.write(through.isoformat())
+
+def append_bars(symbol: str, bars: Dict[str, np.ndarray]):
+    # Append bars newer than the last stored date, trimming any torn tail first
+    dates = np.asarray(bars["date"], dtype="datetime64[D]").astype(np.int64)
+    n = _length(symbol)
+    if n:
+        newer = dates > _open_column(symbol, "date")[n - 1]
+        dates = dates[newer]
+        bars = {column: np.asarray(values)[newer] for column, values in bars.items()}
+    if len(dates) == 0:
+        return 0
+    os.makedirs(_symbol_dir(symbol), exist_ok=True)
+    for column, dtype in COLUMNS.items():
+        path = os.path.join(_symbol_dir(symbol), f"{column}.bin")
+        values = dates if column == "date" else np.asarray(bars.get(column, np.full(len(dates), np.nan)), dtype=dtype)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.truncate(n * np.dtype(dtype).itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+    return len(dates)
+
+def ingest(symbols: Optional[Iterable[str]] = None, provider: Optional[HistoryProvider] = None,
+           today: Optional[date] = None) -> Dict[str, int]:
+    """Fetch only the missing daily bars for each symbol and append them.
+
+    Symbols that need the same start date are fetched in one provider call.
+    Bars are requested up to yesterday so a partial session is never stored.
+    A symbol with no stored bars that gets none is next asked for the days
+    after this fetch only (see checked_through). Returns the number of bars
+    appended per symbol.
+    """
+    import data_fetcher
+    symbols = data_fetcher.get_tracked_symbols() if symbols is None else [s.upper() for s in symbols]
+    provider = provider or data_fetcher.get_history_provider()
+    today = today or date.today()
+    by_start: Dict[date, List[str]] = {}
+    for symbol in symbols:
+        last = last_date(symbol) or checked_through(symbol)
+        start = last + timedelta(days=1) if last else date.fromisoformat(constants.PRICE_HISTORY_START)
+        if start < today:
+            by_start.setdefault(start, []).append(symbol)
+    appended = {symbol: 0 for symbol in symbols}
+    for start, batch in by_start.items():
+        try:
+            fetched = provider(batch, start, today)
+        except Exception as e:
+            print(f"Failed to fetch history for {len(batch)} symbol(s) from {start}: {e}")
+            continue
+        for symbol, bars in fetched.items():
+            if symbol in appended and len(bars.get("date", ())):
+                appended[symbol] = append_bars(symbol, bars)
+        for symbol in batch:
+            if not appended[symbol] and last_date(symbol) is None:
+                _mark_checked(symbol, today - timedelta(days=1))
+    return appended
+
+def load_column(symbol: str, column: str = "close", start: Optional[date] = None,
+                end: Optional[date] = None) -> Tuple[np.ndarray, np.ndarray]:
+    # (dates as datetime64[D], values) for start <= date <= end, read via memmap
+    n = _length(symbol)
+    dates = _open_column(symbol, "date")[:n]
+    lo = 0 if start is None else int(np.searchsorted(dates, np.datetime64(start, "D").astype(np.int64), "left"))
+    hi = n if end is None else int(np.searchsorted(dates, np.datetime64(end, "D").astype(np.int64), "right"))
+    values = _open_column(symbol, column)[lo:hi]
+    return np.array(dates[lo:hi]).astype("datetime64[D]"), np.array(values)
+
+def value_history(holdings: Dict[str, float], start: date, end: date) -> Tuple[np.ndarray, np.ndarray]:
+    """Daily value of fixed holdings ({symbol: shares}) between two dates.
+
+    Symbols are read one at a time and forward-filled onto a shared day axis,
+    so memory stays proportional to the range, not the stored history. Days
+    on which no held symbol traded are dropped.
+    """
+    axis = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1).astype(np.int64)
+    total = np.zeros(len(axis))
+    traded = np.zeros(len(axis), dtype=bool)
+    for symbol, shares in holdings.items():
+        # Include the last close before start so the first days can be forward-filled
+        n = _length(symbol)
+        all_dates = _open_column(symbol, "date")[:n]
+        lo = max(int(np.searchsorted(all_dates, axis[0], "left")) - 1, 0) if len(axis) else 0
+        hi = int(np.searchsorted(all_dates, axis[-1], "right")) if len(axis) else 0
+        dates = np.array(all_dates[lo:hi])
+        closes = np.array(_open_column(symbol, "close")[lo:hi])
+        if len(dates) == 0:
+            continue
+        idx = np.searchsorted(dates, axis, "right") - 1
+        valid = idx >= 0
+        total[valid] += shares * closes[idx[valid]]
+        traded |= np.isin(axis, dates)
+    return axis[traded].astype("datetime64[D]"), total[traded]
+
+def portfolio_history(start: date, end: date, snapshot=None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    # Daily value of today's taxable and IRA holdings over a past date range
+    if snapshot is None:
+        import db
+        snapshot = db.get_portfolio_snapshot()
+    ira: Dict[str, float] = {}
+    for _, _, symbol, shares in snapshot.iter_ira_holdings():
+        ira[symbol] = ira.get(symbol, 0.0) + shares
+    stocks = {symbol.upper(): shares for symbol, shares in snapshot.stocks.items()}
+    # Align both categories on the union of their trading days
+    dates, portfolio = value_history(stocks, start, end)
+    ira_dates, ira_values = value_history(ira, start, end)
+    axis = np.union1d(dates, ira_dates)
+    series = {}
+    for name, (d, v) in {"Portfolio": (dates, portfolio), "IRA Equities": (ira_dates, ira_values)}.items():
+        idx = np.searchsorted(d, axis, "right") - 1
+        series[name] = np.where(idx >= 0, v[np.maximum(idx, 0)] if len(v) else 0.0, 0.0)
+    return axis, series
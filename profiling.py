@@ -0,0 +1,100 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Lightweight hot-path instrumentation. Decorated functions and timer()
+# blocks record call counts and latencies, and db connections count the SQL
+# statements they run, into a per-thread collector between start_render()
+# and finish_render(). Profiling is switched on per thread (one Streamlit
+# session's script runs), so one session turning it on doesn't profile the
+# others; when off every hook is a single flag check.
+
+# FINANCE_PROFILE=1 profiles every thread; never changed at runtime
+ENV_ENABLED = os.environ.get("FINANCE_PROFILE") == "1"
+
+_local = threading.local()
+
+def set_enabled(enabled: bool):
+    # Profile the current thread (or not); threads that never call this follow ENV_ENABLED
+    _local.enabled = enabled
+
+def enabled() -> bool:
+    return getattr(_local, "enabled", ENV_ENABLED)
+
+def _collector() -> Optional[dict]:
+    return getattr(_local, "collector", None)
+
+def start_render():
+    # Begin collecting for the current thread (one Streamlit script run)
+    _local.collector = {"start": time.perf_counter(), "timings": {}, "db_queries": 0}
+
+def finish_render() -> Optional[dict]:
+    # Stop collecting and return {"total_ms", "db_queries", "timings": {name: {calls, total_ms, max_ms}}}
+    collector = _collector()
+    _local.collector = None
+    if collector is None:
+        return None
+    return {
+        "total_ms": (time.perf_counter() - collector["start"]) * 1000,
+        "db_queries": collector["db_queries"],
+        "timings": collector["timings"],
+    }
+
+def _record(name: str, elapsed: float):
+    collector = _collector()
+    if collector is None:
+        return
+    stats = collector["timings"].get(name)
+    if stats is None:
+        stats = collector["timings"][name] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0}
+    ms = elapsed * 1000
+    stats["calls"] += 1
+    stats["total_ms"] += ms
+    stats["max_ms"] = max(stats["max_ms"], ms)
+
+def timed(name: Optional[str] = None):
+    # Decorator recording each call of the wrapped function
+    def decorator(fn):
+        label = name or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record(label, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+@contextmanager
+def timer(name: str):
+    # Context manager recording the enclosed block
+    if not enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+def count_query(statement: str):
+    # sqlite3 trace callback; see db.get_connection
+    if enabled():
+        collector = _collector()
+        if collector is not None:
+            collector["db_queries"] += 1
+
+def report_json(report: dict) -> str:
+    return json.dumps(report, sort_keys=True)
+
+def log_report(report: dict):
+    # One log line per render
+    print(f"[profile] {report_json(report)}")
@@ -0,0 +1,63 @@
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+import constants
+import db
+import profiling
+import read_cache
+
+# SQLite-backed quote cache. Prices survive restarts and are shared by every
+# Streamlit process using the same DB, so a render can start from the last
+# known prices instead of a cold network fetch.
+
+class Quote(NamedTuple):
+    symbol: str
+    price: float
+    as_of: float    # unix timestamp
+    source: str     # e.g. "yfinance" or "mock"
+
+def get_ttl(symbol: str) -> float:
+    asset_class = constants.ASSET_CLASSES.get(symbol.upper(), "equity")
+    return constants.QUOTE_TTL_SECONDS.get(asset_class, constants.QUOTE_TTL_SECONDS["equity"])
+
+def is_stale(quote: Optional[Quote], now: Optional[float] = None) -> bool:
+    if quote is None:
+        return True
+    now = time.time() if now is None else now
+    return now - quote.as_of > get_ttl(quote.symbol)
+
+@profiling.timed()
+def store_quotes(prices: Dict[str, float], source: str, as_of: Optional[float] = None):
+    as_of = time.time() if as_of is None else as_of
+    with db.transaction() as conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO quotes (symbol, price, as_of, source) VALUES (?, ?, ?, ?)',
+            [(symbol.upper(), float(price), as_of, source) for symbol, price in prices.items()]
+        )
+        db.mark_changed("quotes")
+
+@profiling.timed()
+@read_cache.cached("quotes")
+def get_quotes() -> Dict[str, Quote]:
+    rows = db.get_connection().execute('SELECT symbol, price, as_of, source FROM quotes').fetchall()
+    return {row[0]: Quote(*row) for row in rows}
+
+@profiling.timed()
+def load_cached_prices() -> Dict[str, Quote]:
+    # Fill STOCK_PRICES from the cache, whatever the age of each entry
+    quotes = get_quotes()
+    changed = False
+    for symbol, quote in quotes.items():
+        if constants.STOCK_PRICES.get(symbol) != quote.price:
+            constants.STOCK_PRICES[symbol] = quote.price
+            changed = True
+    if changed:
+        db.bump_data_version("prices")
+    return quotes
+
+@profiling.timed()
+def get_stale_symbols(symbols: Iterable[str], quotes: Optional[Dict[str, Quote]] = None,
+                      now: Optional[float] = None) -> List[str]:
+    # Symbols with no cached quote or one older than its asset class TTL
+    quotes = get_quotes() if quotes is None else quotes
+    now = time.time() if now is None else now
+    return [symbol for symbol in symbols if is_stale(quotes.get(symbol.upper()), now)]
@@ -0,0 +1,50 @@
+import functools
+import threading
+from collections import OrderedDict
+from datetime import date
+
+# Versioned read cache shared by every session in the process. Entries are
+# keyed on the db.data_version() of the tables a read depends on, so a
+# Streamlit rerun that changed nothing is served from memory and any write
+# invalidates exactly the reads (and derived views) that depend on it.
+# Cached values are shared: callers must treat them as read-only.
+
+MAX_ENTRIES = 512
+
+_entries: "OrderedDict[tuple, object]" = OrderedDict()
+_lock = threading.Lock()
+_MISSING = object()
+
+def cached(*sources: str, daily: bool = False):
+    """Cache a function's result per argument tuple and data version.
+
+    sources are table names (or other names passed to db.bump_data_version,
+    such as "prices"). daily=True also keys on today's date, for values that
+    accrue over time such as treasury valuations.
+    """
+    def decorator(fn):
+        name = f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            import db
+            key = (name, db.current_db(), db.data_version(*sources), date.today() if daily else None,
+                   args, tuple(sorted(kwargs.items())))
+            with _lock:
+                value = _entries.get(key, _MISSING)
+                if value is not _MISSING:
+                    _entries.move_to_end(key)
+                    return value
+            value = fn(*args, **kwargs)
+            with _lock:
+                _entries[key] = value
+                while len(_entries) > MAX_ENTRIES:
+                    _entries.popitem(last=False)
+            return value
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
+
+def clear():
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,142 @@
+import threading
+import time
+from typing import Iterable, List, NamedTuple, Optional
+import constants
+import data_fetcher
+import db
+import quote_cache
+import store
+
+# Process-wide background price refresher. One daemon thread keeps the quote
+# cache warm for the union of symbols across all accounts of every open
+# portfolio (see store.open_databases): every REFRESH_INTERVAL seconds (or
+# sooner, when woken by request_refresh) it fetches the quotes whose TTL has
+# expired, once, and stores them in each portfolio's quote cache. Sessions
+# only read cached prices, so renders never wait on the network and the quote
+# provider is hit once per interval however many sessions are open.
+REFRESH_INTERVAL = 60
+
+class RefresherStatus(NamedTuple):
+    running: bool
+    cycles: int                 # refresh passes completed
+    last_run: Optional[float]   # unix timestamp the last pass finished
+    last_duration: float        # seconds
+    last_refreshed: int         # symbols fetched in the last pass
+    last_error: Optional[str]
+
+_lock = threading.Lock()
+_cycle_done = threading.Condition(_lock)
+_wake = threading.Event()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+_force = False
+_in_progress = False
+_seen = set()       # symbols considered by at least one pass
+_status = RefresherStatus(False, 0, None, 0.0, 0, None)
+
+def tracked_symbols() -> List[str]:
+    # Every symbol held in any account, plus the yield curve when it is used
+    symbols = data_fetcher.get_tracked_symbols()
+    if constants.MARK_TREASURIES_TO_MARKET:
+        from treasury import YIELD_CURVE_TICKERS
+        symbols += [ticker for ticker in YIELD_CURVE_TICKERS.values() if ticker not in symbols]
+    return symbols
+
+def refresh_once(force: bool = False) -> int:
+    # One refresh pass; returns how many symbols were fetched
+    stale_by_db = {}
+    for db_file in store.open_databases() or [db.current_db()]:
+        with db.use_database(db_file):
+            symbols = tracked_symbols()
+            _seen.update(symbols)
+            stale_by_db[db_file] = symbols if force else quote_cache.get_stale_symbols(symbols)
+    fetch = sorted(set().union(*stale_by_db.values()))
+    if not fetch:
+        return 0
+    provider, source = data_fetcher.get_quote_provider()
+    if data_fetcher.USE_MOCK:
+        data_fetcher.advance_mock_market(fetch)
+    results = data_fetcher.refresh_prices(fetch, provider)
+    prices = {symbol: result.price for symbol, result in results.items() if result.price is not None}
+    as_of = time.time()
+    for db_file, stale in stale_by_db.items():
+        fetched = {symbol: prices[symbol] for symbol in stale if symbol in prices}
+        if fetched:
+            with db.use_database(db_file):
+                quote_cache.store_quotes(fetched, source, as_of)
+    return len(fetch)
+
+def _run(interval: float):
+    global _force, _in_progress, _status
+    while not _stop.is_set():
+        with _lock:
+            force, _force = _force, False
+            _in_progress = True
+            _wake.clear()
+        start = time.perf_counter()
+        refreshed, error = 0, None
+        try:
+            refreshed = refresh_once(force)
+        except Exception as e:
+            error = str(e)
+            print(f"Background price refresh failed: {e}")
+        with _lock:
+            _status = RefresherStatus(True, _status.cycles + 1, time.time(),
+                                      time.perf_counter() - start, refreshed, error)
+            _in_progress = False
+            _cycle_done.notify_all()
+        _wake.wait(interval)
+    db.close_connections()
+
+def start(interval: float = REFRESH_INTERVAL) -> bool:
+    """Start the refresher thread unless it is already running.
+
+    Safe to call on every render; returns True only for the call that started it.
+    """
+    global _thread, _status
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return False
+        _stop.clear()
+        _status = _status._replace(running=True)
+        _thread = threading.Thread(target=_run, args=(interval,), name="price-refresher", daemon=True)
+        _thread.start()
+        return True
+
+def stop(timeout: Optional[float] = None):
+    global _thread, _status
+    _stop.set()
+    _wake.set()
+    if _thread is not None:
+        _thread.join(timeout)
+    with _lock:
+        _thread = None
+        _status = _status._replace(running=False)
+
+def request_refresh(force: bool = False, timeout: Optional[float] = None) -> bool:
+    """Wake the refresher for an early pass (force=True refetches every symbol).
+
+    With a timeout, wait up to that many seconds for the pass to finish and
+    return whether it did. Requests made while a pass is running are served
+    by the next one.
+    """
+    global _force
+    with _lock:
+        _force = _force or force
+        # A pass already under way may have read its symbols before this request
+        target = _status.cycles + (2 if _in_progress else 1)
+        _wake.set()
+        if timeout is None:
+            return False
+        return _cycle_done.wait_for(lambda: _status.cycles >= target, timeout)
+
+def watch(symbols: Iterable[str]) -> bool:
+    # Wake the refresher early if any of symbols is new to it (e.g. just
+    # added); symbols it already tried wait for the next interval.
+    if set(symbols) - _seen:
+        request_refresh()
+        return True
+    return False
+
+def status() -> RefresherStatus:
+    return _status
@@ -1,4 +1,7 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
 from constants import RETIREMENT_ACCOUNTS
+import profiling
 
 def add_retirement(account_type: str, amount: float):
     # Add or update a retirement account balance.
@@ -27,3 +30,121 @@ def get_ira_value(account_type: str, stock_prices: dict) -> float:
         price = stock_prices.get(symbol, 0.0)
         total += price * shares
     return total
+
+# ---------------- Monte Carlo Projection ----------------
+# Retirement balances are projected over many simulated market paths. Each
+# year every account grows by a lognormal return and then receives its
+# contribution; all accounts share the year's market shock, so they move
+# together as a diversified portfolio would. Paths are simulated in
+# fixed-size chunks with their own seeds, so results don't depend on how many
+# worker processes ran them.
+DEFAULT_MEAN_RETURN = 0.07      # expected annual return
+DEFAULT_VOLATILITY = 0.15       # annual standard deviation of returns
+PERCENTILES = (5, 25, 50, 75, 95)
+CHUNK_PATHS = 25_000
+
+class ProjectionAccount(NamedTuple):
+    key: str                    # valuation account key, e.g. "retirement:3"
+    label: str
+    balance: float              # starting value
+    contribution: float = 0.0   # contribution in the first year
+    mean_return: float = DEFAULT_MEAN_RETURN
+    volatility: float = DEFAULT_VOLATILITY
+
+class Projection(NamedTuple):
+    years: np.ndarray               # 0..horizon
+    percentiles: Tuple[int, ...]
+    bands: np.ndarray               # total balance, one row per percentile, one column per year
+    final_by_account: Dict[str, np.ndarray]  # account key -> percentiles of its final balance
+    mean_final: float
+    paths: int
+
+def contribution_schedule(annual: float, years: int, growth: float = 0.0,
+                          stop_after: Optional[int] = None) -> np.ndarray:
+    # Contribution for each year: annual, growing by growth per year, and zero
+    # from year stop_after on (e.g. after retiring)
+    schedule = annual * (1 + growth) ** np.arange(years)
+    if stop_after is not None:
+        schedule[stop_after:] = 0.0
+    return schedule
+
+def _lognormal_params(mean_return: np.ndarray, volatility: np.ndarray):
+    # mu/sigma of log(1 + r) matching the given arithmetic mean and volatility
+    gross = 1 + mean_return
+    sigma2 = np.log1p((volatility / gross) ** 2)
+    return np.log(gross) - sigma2 / 2, np.sqrt(sigma2)
+
+def _simulate_chunk(args) -> Tuple[np.ndarray, np.ndarray]:
+    # (total balance per path and year, final balance per path and account)
+    start, schedules, mu, sigma, paths, seed = args
+    rng = np.random.default_rng(seed)
+    years = schedules.shape[1]
+    wealth = np.repeat(start[:, None], paths, axis=1)      # accounts x paths
+    totals = np.empty((paths, years + 1))
+    totals[:, 0] = wealth.sum(axis=0)
+    for year in range(years):
+        shock = rng.standard_normal(paths)
+        wealth *= np.exp(mu[:, None] + sigma[:, None] * shock)
+        wealth += schedules[:, year, None]
+        totals[:, year + 1] = wealth.sum(axis=0)
+    return totals, wealth.T
+
+@profiling.timed()
+def project(accounts: List[ProjectionAccount], years: int = 30, paths: int = 10_000,
+            contribution_growth: float = 0.0, contribution_years: Optional[int] = None,
+            inflation: float = 0.0, percentiles: Tuple[int, ...] = PERCENTILES,
+            seed: Optional[int] = None, workers: int = 1) -> Projection:
+    """Simulate paths of every account's balance over years.
+
+    Contributions start at each account's contribution, grow by
+    contribution_growth a year and stop after contribution_years. With
+    inflation > 0 the results are in today's dollars. workers > 1 spreads
+    the chunks over a process pool.
+    """
+    start = np.array([a.balance for a in accounts], dtype=float)
+    schedules = np.array([contribution_schedule(a.contribution, years, contribution_growth, contribution_years)
+                          for a in accounts], dtype=float).reshape(len(accounts), years)
+    mu, sigma = _lognormal_params(np.array([a.mean_return for a in accounts], dtype=float),
+                                  np.array([a.volatility for a in accounts], dtype=float))
+    chunk_sizes = [min(CHUNK_PATHS, paths - offset) for offset in range(0, paths, CHUNK_PATHS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    tasks = [(start, schedules, mu, sigma, size, chunk_seed) for size, chunk_seed in zip(chunk_sizes, seeds)]
+    if workers > 1 and len(tasks) > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # Spawned, not forked: the server process has other threads (tornado,
+        # the refresher, the live feed) and open SQLite connections, and
+        # spawn is what the frozen Windows build uses anyway
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(_simulate_chunk, tasks))
+    else:
+        results = [_simulate_chunk(task) for task in tasks]
+    totals = np.concatenate([r[0] for r in results])
+    finals = np.concatenate([r[1] for r in results])
+
+    deflator = (1 + inflation) ** np.arange(years + 1)
+    totals /= deflator
+    finals /= deflator[-1]
+    return Projection(
+        years=np.arange(years + 1),
+        percentiles=tuple(percentiles),
+        bands=np.percentile(totals, percentiles, axis=0),
+        final_by_account={a.key: np.percentile(finals[:, i], percentiles) for i, a in enumerate(accounts)},
+        mean_final=float(totals[:, -1].mean()),
+        paths=paths,
+    )
+
+def projection_accounts(contributions: Optional[Dict[str, float]] = None,
+                        mean_return: float = DEFAULT_MEAN_RETURN,
+                        volatility: float = DEFAULT_VOLATILITY) -> List[ProjectionAccount]:
+    # Retirement accounts of the current database at their current value
+    # (balances plus IRA holdings at current prices)
+    import valuation
+    _, positions, values = valuation.current_valuation()
+    contributions = contributions or {}
+    return [
+        ProjectionAccount(account.key, account.label, values.by_account[account.key],
+                          contributions.get(account.key, 0.0), mean_return, volatility)
+        for account in positions.accounts if account.key.startswith("retirement:")
+    ]
@@ -0,0 +1,189 @@
+import threading
+from statistics import NormalDist
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+import numpy as np
+import price_history
+import profiling
+
+# Portfolio risk from the local price history (see price_history.py): the
+# taxable portfolio and every IRA holding, valued at today's shares.
+#
+# Closes for the held symbols are aligned on one trading-day axis (forward
+# filled) and turned into a daily-return matrix once; the matrix is cached per
+# symbol set and later calls only read and append the bars ingested since.
+# Every statistic is then a handful of matrix operations over a trailing
+# window of that matrix.
+
+TRADING_DAYS = 252
+
+# Dashboard windows, in trading days (None: all stored history)
+WINDOWS = {"3 Months": 63, "6 Months": 126, "1 Year": 252, "3 Years": 756, "10 Years": 2520, "All": None}
+DEFAULT_CONFIDENCE = 0.95
+
+class ReturnMatrix(NamedTuple):
+    symbols: Tuple[str, ...]
+    dates: np.ndarray       # datetime64[D], one per row of closes
+    closes: np.ndarray      # (days, symbols), forward filled; NaN before a symbol's first bar
+    returns: np.ndarray     # (days - 1, symbols) simple daily returns; 0 where undefined
+
+class RiskReport(NamedTuple):
+    symbols: Tuple[str, ...]
+    start: Optional[np.datetime64]  # first and last day of the window
+    end: Optional[np.datetime64]
+    days: int                       # daily returns in the window
+    value: float                    # holdings at the last close
+    exposure: np.ndarray            # dollars per symbol at the last close
+    volatility: float               # annualized, of the whole portfolio
+    symbol_volatility: np.ndarray   # annualized, per symbol
+    correlation: np.ndarray         # (symbols, symbols)
+    confidence: float
+    var_historical: float           # one-day loss not exceeded with the given confidence, in dollars
+    var_parametric: float           # the same under a normal model of the window's returns
+    max_drawdown: float             # largest peak-to-trough fall of the holdings' value, as a fraction
+    missing: Tuple[str, ...]        # held symbols without stored history
+
+_cache: Dict[Tuple[str, ...], Tuple[ReturnMatrix, Dict[str, int]]] = {}
+_cache_lock = threading.Lock()
+MAX_CACHED_MATRICES = 8
+
+def _aligned_closes(lengths: Dict[str, int], since: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    # (days as int64, forward-filled closes) over the first lengths[symbol]
+    # stored bars of each symbol, for the trading days >= since, seeded with
+    # each symbol's last close before it
+    columns = []
+    for symbol, n in lengths.items():
+        dates = price_history._open_column(symbol, "date")[:n]
+        lo = 0 if since is None else max(int(np.searchsorted(dates, since, "left")) - 1, 0)
+        columns.append((np.array(dates[lo:]), np.array(price_history._open_column(symbol, "close")[lo:n])))
+    axis = np.unique(np.concatenate([dates for dates, _ in columns])) if columns else np.zeros(0, np.int64)
+    if since is not None:
+        axis = axis[axis >= since]
+    closes = np.full((len(axis), len(lengths)), np.nan)
+    for j, (dates, values) in enumerate(columns):
+        idx = np.searchsorted(dates, axis, "right") - 1
+        valid = idx >= 0
+        closes[valid, j] = values[idx[valid]]
+    return axis, closes
+
+def _returns(closes: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        returns = closes[1:] / closes[:-1] - 1.0
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+@profiling.timed()
+def return_matrix(symbols: Iterable[str]) -> ReturnMatrix:
+    """The aligned close and daily-return matrix for symbols.
+
+    The first call for a symbol set reads its full history; later calls only
+    read bars appended since (rebuilding the rows from the earliest new bar
+    on, in case a lagging symbol caught up) and reuse the cached rows before.
+    """
+    key = tuple(sorted({symbol.upper() for symbol in symbols}))
+    with _cache_lock:
+        cached = _cache.get(key)
+        current = {symbol: price_history._length(symbol) for symbol in key}
+        if cached is not None and current == cached[1]:
+            return cached[0]
+        if cached is not None and all(current[s] >= n for s, n in cached[1].items()):
+            matrix, lengths = cached
+            # Earliest newly stored day across the symbols that grew
+            since = min(int(price_history._open_column(s, "date")[n]) for s, n in lengths.items() if current[s] > n)
+            keep = int(np.searchsorted(matrix.dates.astype(np.int64), since, "left"))
+            axis, tail = _aligned_closes(current, since)
+            closes = np.vstack([matrix.closes[:keep], tail])
+            dates = np.concatenate([matrix.dates[:keep], axis.astype("datetime64[D]")])
+            # Returns up to row keep - 1 are unchanged
+            start = max(keep - 1, 0)
+            returns = np.vstack([matrix.returns[:start], _returns(closes[start:])])
+        else:
+            axis, closes = _aligned_closes(current)
+            dates = axis.astype("datetime64[D]")
+            returns = _returns(closes)
+        matrix = ReturnMatrix(key, dates, closes, returns)
+        _cache[key] = (matrix, current)
+        while len(_cache) > MAX_CACHED_MATRICES:
+            _cache.pop(next(iter(_cache)))
+        return matrix
+
+def holdings(snapshot=None) -> Dict[str, float]:
+    # Shares per symbol across the taxable portfolio and every IRA account
+    if snapshot is None:
+        import db
+        snapshot = db.get_portfolio_snapshot()
+    combined: Dict[str, float] = {}
+    for symbol, shares in snapshot.stocks.items():
+        combined[symbol.upper()] = combined.get(symbol.upper(), 0.0) + shares
+    for _, _, symbol, shares in snapshot.iter_ira_holdings():
+        combined[symbol] = combined.get(symbol, 0.0) + shares
+    return combined
+
+@profiling.timed()
+def risk_report(shares: Dict[str, float], window: Optional[int] = TRADING_DAYS,
+                confidence: float = DEFAULT_CONFIDENCE) -> RiskReport:
+    """Risk of fixed holdings ({symbol: shares}) over the last window trading days.
+
+    Positions are sized at the last stored close. Daily P&L is the return
+    matrix times those dollar exposures; volatility and correlation come from
+    the window's covariance matrix, and the drawdown from the holdings' daily
+    value over the window.
+    """
+    matrix = return_matrix(shares)
+    have = np.array([len(matrix.closes) > 0 and not np.isnan(matrix.closes[-1, j])
+                     for j in range(len(matrix.symbols))], dtype=bool)
+    missing = tuple(symbol for symbol, ok in zip(matrix.symbols, have) if not ok)
+    symbols = tuple(symbol for symbol, ok in zip(matrix.symbols, have) if ok)
+    held = np.array([shares.get(symbol, 0.0) for symbol in symbols])
+    closes = matrix.closes[:, have]
+    returns = matrix.returns[:, have]
+    if window is not None:
+        returns = returns[-window:]
+    days = len(returns)
+    closes = closes[len(closes) - days - 1:] if days else closes[-1:]
+    dates = matrix.dates[len(matrix.dates) - len(closes):]
+
+    exposure = held * closes[-1] if len(closes) else held * 0.0
+    value = float(exposure.sum())
+    if days < 2:
+        n = len(symbols)
+        return RiskReport(symbols, dates[0] if len(dates) else None, dates[-1] if len(dates) else None,
+                          days, value, exposure, 0.0, np.zeros(n), np.eye(n), confidence, 0.0, 0.0, 0.0, missing)
+
+    centered = returns - returns.mean(axis=0)
+    cov = centered.T @ centered / (days - 1)
+    sd = np.sqrt(np.diag(cov))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = np.nan_to_num(cov / np.outer(sd, sd))
+    np.fill_diagonal(correlation, 1.0)
+
+    pnl = returns @ exposure                                # dollars per day at today's sizes
+    pnl_sd = float(np.sqrt(max(exposure @ cov @ exposure, 0.0)))
+    z = NormalDist().inv_cdf(confidence)
+    var_historical = max(-float(np.quantile(pnl, 1.0 - confidence)), 0.0)
+    var_parametric = max(z * pnl_sd - float(pnl.mean()), 0.0)
+
+    # Value of today's shares on each day of the window (unlisted days count as 0)
+    path = np.nan_to_num(closes) @ held
+    peaks = np.maximum.accumulate(path)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drawdowns = np.where(peaks > 0, 1.0 - path / peaks, 0.0)
+
+    return RiskReport(
+        symbols=symbols,
+        start=dates[0],
+        end=dates[-1],
+        days=days,
+        value=value,
+        exposure=exposure,
+        volatility=pnl_sd / value * np.sqrt(TRADING_DAYS) if value > 0 else 0.0,
+        symbol_volatility=sd * np.sqrt(TRADING_DAYS),
+        correlation=correlation,
+        confidence=confidence,
+        var_historical=var_historical,
+        var_parametric=var_parametric,
+        max_drawdown=float(drawdowns.max()),
+        missing=missing,
+    )
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
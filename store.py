@@ -0,0 +1,106 @@
+import threading
+from types import MappingProxyType
+from typing import Dict, List, Mapping, NamedTuple, Optional
+import constants
+import db
+import profiling
+
+# In-memory portfolio state, one PortfolioStore per database, so a single
+# process can serve several portfolios at once. State is copy-on-write:
+# writers build new mappings under the store's lock and publish them in one
+# assignment, so readers get a consistent PortfolioState without locking and
+# never see a half-applied change.
+
+class PortfolioState(NamedTuple):
+    stocks: Mapping[str, float]             # taxable symbol -> shares
+    cash: Mapping[str, float]               # cash account -> balance
+    treasuries: Mapping[str, Mapping]       # name -> db.treasury_record(...)
+
+class PortfolioStore:
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._state: Optional[PortfolioState] = None
+
+    @property
+    def state(self) -> PortfolioState:
+        # Current state, loaded from the database on first use
+        state = self._state
+        return state if state is not None else self.load()
+
+    @profiling.timed("store.load")
+    def load(self) -> PortfolioState:
+        # Replace the state with a fresh read of the database. The lock is held
+        # across the read so a delta committed meanwhile is applied after it,
+        # not lost under it.
+        with self._lock:
+            with db.use_database(self.db_file), db.transaction(immediate=False) as conn:
+                stocks = conn.execute('SELECT symbol, shares FROM stocks').fetchall()
+                cash = conn.execute('SELECT name, balance FROM cash_accounts').fetchall()
+                treasuries = conn.execute('SELECT name, type, face_value, interest_rate, purchase_date, maturity_date FROM treasuries').fetchall()
+            balances = dict.fromkeys(constants.CASH_ACCOUNTS, 0.0)
+            balances.update(cash)
+            self._state = PortfolioState(
+                stocks=MappingProxyType(dict(stocks)),
+                cash=MappingProxyType(balances),
+                treasuries=MappingProxyType({name: MappingProxyType(db.treasury_record(*row)) for name, *row in treasuries}),
+            )
+            return self._state
+
+    def apply(self, stocks: Optional[Dict] = None, cash: Optional[Dict] = None,
+              treasuries: Optional[Dict] = None):
+        """Apply write-through deltas ({key: value, or None to remove}).
+
+        A store that has not loaded yet ignores them; it reads the committed
+        rows when first used.
+        """
+        with self._lock:
+            state = self._state
+            if state is None:
+                return
+            self._state = PortfolioState(
+                stocks=_updated(state.stocks, stocks),
+                cash=_updated(state.cash, cash),
+                treasuries=_updated(state.treasuries, treasuries and {
+                    name: None if record is None else MappingProxyType(dict(record))
+                    for name, record in treasuries.items()
+                }),
+            )
+
+def _updated(mapping: Mapping, changes: Optional[Dict]) -> Mapping:
+    if not changes:
+        return mapping
+    copy = mapping.copy()  # a plain dict copy of the underlying mapping
+    for key, value in changes.items():
+        if value is None:
+            copy.pop(key, None)
+        else:
+            copy[key] = value
+    return MappingProxyType(copy)
+
+# --- Registry ---
+_stores: Dict[str, PortfolioStore] = {}
+_stores_lock = threading.Lock()
+
+def get_store(db_file: Optional[str] = None) -> PortfolioStore:
+    # The store for db_file (default: db.current_db()), created on first use
+    db_file = db_file or db.current_db()
+    store = _stores.get(db_file)
+    if store is None:
+        with _stores_lock:
+            store = _stores.setdefault(db_file, PortfolioStore(db_file))
+    return store
+
+def current() -> PortfolioState:
+    # State of the current database's store
+    return get_store().state
+
+def open_databases() -> List[str]:
+    # Databases with a store in this process (e.g. for the background refresher)
+    return list(_stores)
+
+@db.subscribe
+def _reload_on_external_change(event: db.ChangeEvent):
+    store = _stores.get(event.db_file)
+    if event.external and store is not None and store._state is not None:
+        store.load()
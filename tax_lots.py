@@ -0,0 +1,299 @@
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+import db
+import profiling
+import read_cache
+
+# Tax-lot ledger for the taxable portfolio and IRA accounts. Each purchase is
+# a lot (acquisition date, shares, cost per share); sales consume lots FIFO,
+# LIFO or by specific ID and are kept in the disposals table with their
+# basis and proceeds. The triggers in migrations._tax_lots maintain
+# lot_positions (per account and symbol) and lot_symbols (per symbol), so
+# readers get quantities and cost basis from those rows however many lots
+# there are.
+#
+# Purchases and sales also move the shares in stocks / ira_holdings, which
+# everything else values from, in the same transaction. Shares added there
+# directly (Add Stock, imports) have no lots and no known basis; shares
+# removed there directly close lots newest first (close_excess_lots), so a
+# position's lots never hold more than the account does.
+
+TAXABLE = 0  # account_id of the taxable portfolio
+METHODS = ("FIFO", "LIFO", "Specific ID")
+LONG_TERM_DAYS = 365  # held longer than this is a long-term gain
+
+class Disposal(NamedTuple):
+    lot_id: int
+    acquired: str
+    quantity: float
+    unit_cost: float
+    unit_proceeds: float
+
+    @property
+    def gain(self) -> float:
+        return self.quantity * (self.unit_proceeds - self.unit_cost)
+
+class LotPositions(NamedTuple):
+    account_ids: np.ndarray
+    symbols: List[str]
+    quantity: np.ndarray
+    cost: np.ndarray
+    lots: np.ndarray
+
+class UnrealizedGains(NamedTuple):
+    positions: LotPositions
+    prices: np.ndarray      # NaN where no price is known
+    value: np.ndarray
+    gain: np.ndarray        # value - cost (NaN without a price)
+
+class LotBook(NamedTuple):
+    ids: np.ndarray
+    account_ids: np.ndarray
+    symbols: List[str]
+    acquired: np.ndarray    # datetime64[D]
+    quantity: np.ndarray
+    unit_cost: np.ndarray
+
+# ---------------- Writes ----------------
+def _held_shares(conn, account_id: int, symbol: str) -> float:
+    # Shares of symbol the account holds in stocks / ira_holdings
+    if account_id == TAXABLE:
+        row = conn.execute('SELECT shares FROM stocks WHERE symbol = ?', (symbol,)).fetchone()
+    else:
+        row = conn.execute('SELECT shares FROM ira_holdings WHERE account_id = ? AND symbol = ?',
+                           (account_id, symbol)).fetchone()
+    return row[0] if row else 0.0
+
+def _adjust_shares(conn, account_id: int, symbol: str, delta: float):
+    # Move the position in stocks / ira_holdings by delta shares
+    if account_id == TAXABLE:
+        if delta > 0:
+            db.add_stock(symbol, delta)
+            return
+        shares = _held_shares(conn, account_id, symbol) + delta
+        if shares > 1e-9:
+            db.update_stock_shares(symbol, shares)
+        else:
+            db.remove_stock(symbol)
+        return
+    if delta > 0:
+        db.add_ira_holding(account_id, symbol, delta)
+        return
+    row = conn.execute('SELECT id, shares FROM ira_holdings WHERE account_id = ? AND symbol = ?',
+                       (account_id, symbol)).fetchone()
+    if row is None:
+        return
+    holding_id, shares = row
+    if shares + delta > 1e-9:
+        db.update_ira_holding_shares(holding_id, shares + delta)
+    else:
+        db.remove_ira_holding(holding_id)
+
+@profiling.timed()
+def buy(account_id: int, symbol: str, quantity: float, unit_cost: float,
+        acquired: Optional[str] = None) -> int:
+    """Record a purchase as a new lot and add the shares to the account; returns the lot id."""
+    symbol = symbol.strip().upper()
+    if not symbol or quantity <= 0 or unit_cost < 0:
+        raise ValueError("A purchase needs a symbol, a positive quantity and a cost of at least 0")
+    with db.transaction() as conn:
+        c = conn.execute('INSERT INTO lots (account_id, symbol, acquired, quantity, unit_cost) VALUES (?, ?, ?, ?, ?)',
+                         (account_id, symbol, acquired or date.today().isoformat(), quantity, unit_cost))
+        _adjust_shares(conn, account_id, symbol, quantity)
+        db.mark_changed("lots")
+        return c.lastrowid
+
+@profiling.timed()
+def sell(account_id: int, symbol: str, quantity: float, unit_price: float, method: str = "FIFO",
+         lot_ids: Sequence[int] = (), disposed: Optional[str] = None) -> List[Disposal]:
+    """Dispose of shares from the account's lots and remove them from the account.
+
+    FIFO takes the oldest lots first, LIFO the newest, and "Specific ID" the
+    lots in lot_ids, in that order. Raises ValueError if the chosen lots or
+    the account hold fewer shares than quantity.
+    """
+    symbol = symbol.strip().upper()
+    if method not in METHODS:
+        raise ValueError(f"Unknown lot method: {method}")
+    if quantity <= 0:
+        raise ValueError("Quantity must be positive")
+    disposed = disposed or date.today().isoformat()
+    with db.transaction() as conn:
+        rows = conn.execute('''
+            SELECT id, acquired, quantity, unit_cost FROM lots
+            WHERE account_id = ? AND symbol = ? ORDER BY acquired, id
+        ''', (account_id, symbol)).fetchall()
+        if method == "LIFO":
+            rows.reverse()
+        elif method == "Specific ID":
+            by_id = {row[0]: row for row in rows}
+            missing = [lot_id for lot_id in lot_ids if lot_id not in by_id]
+            if missing:
+                raise ValueError(f"No open {symbol} lot(s) {missing} in this account")
+            rows = [by_id[lot_id] for lot_id in dict.fromkeys(lot_ids)]
+        held = np.array([row[2] for row in rows], dtype=float)
+        if held.sum() < quantity - 1e-9:
+            raise ValueError(f"Only {held.sum():g} {symbol} shares in the selected lots")
+        in_account = _held_shares(conn, account_id, symbol)
+        if in_account < quantity - 1e-9:
+            raise ValueError(f"Only {in_account:g} {symbol} shares held in this account")
+        # Shares taken from each lot, in order
+        before = np.cumsum(held) - held
+        take = np.clip(quantity - before, 0.0, held)
+        used = take > 0
+        emptied = used & (take >= held - 1e-9)
+        disposals = [Disposal(row[0], row[1], float(t), row[3], unit_price)
+                     for row, t, u in zip(rows, take, used) if u]
+        conn.executemany('DELETE FROM lots WHERE id = ?', [(row[0],) for row, e in zip(rows, emptied) if e])
+        conn.executemany('UPDATE lots SET quantity = quantity - ? WHERE id = ?',
+                         [(float(t), row[0]) for row, t, u, e in zip(rows, take, used, emptied) if u and not e])
+        conn.executemany('''
+            INSERT INTO disposals (lot_id, account_id, symbol, acquired, disposed, quantity, unit_cost, unit_proceeds)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(d.lot_id, account_id, symbol, d.acquired, disposed, d.quantity, d.unit_cost, d.unit_proceeds)
+              for d in disposals])
+        _adjust_shares(conn, account_id, symbol, -quantity)
+        db.mark_changed("lots")
+    return disposals
+
+@profiling.timed()
+def close_excess_lots(positions: Optional[Iterable[Tuple[int, str]]] = None) -> float:
+    """Close lots holding more shares than their account; returns the shares closed.
+
+    Called by the writes that remove shares other than through sell()
+    (removing or editing a holding, replacing it by import). The newest lots
+    go first and no disposal is recorded. positions limits the check to those
+    (account_id, symbol) pairs; by default every lot position is checked.
+    """
+    closed = 0.0
+    with db.transaction() as conn:
+        if positions is None:
+            positions = conn.execute('SELECT account_id, symbol FROM lot_positions').fetchall()
+        for account_id, symbol in positions:
+            symbol = symbol.upper()
+            row = conn.execute('SELECT quantity FROM lot_positions WHERE account_id = ? AND symbol = ?',
+                               (account_id, symbol)).fetchone()
+            excess = (row[0] if row else 0.0) - _held_shares(conn, account_id, symbol)
+            if excess <= 1e-9:
+                continue
+            lots = conn.execute('SELECT id, quantity FROM lots WHERE account_id = ? AND symbol = ? '
+                                'ORDER BY acquired DESC, id DESC', (account_id, symbol)).fetchall()
+            for lot_id, quantity in lots:
+                if excess <= 1e-9:
+                    break
+                take = min(quantity, excess)
+                if quantity - take > 1e-9:
+                    conn.execute('UPDATE lots SET quantity = ? WHERE id = ?', (quantity - take, lot_id))
+                else:
+                    conn.execute('DELETE FROM lots WHERE id = ?', (lot_id,))
+                excess -= take
+                closed += take
+        if closed:
+            db.mark_changed("lots")
+    return closed
+
+# ---------------- Reads ----------------
+@profiling.timed()
+@read_cache.cached("lots")
+def get_positions() -> LotPositions:
+    # Lot quantities and cost basis per (account, symbol), from the maintained aggregates
+    rows = db.get_connection().execute(
+        'SELECT account_id, symbol, quantity, cost, lots FROM lot_positions ORDER BY account_id, symbol').fetchall()
+    return LotPositions(
+        account_ids=np.array([row[0] for row in rows], dtype=np.int64),
+        symbols=[row[1] for row in rows],
+        quantity=np.array([row[2] for row in rows], dtype=float),
+        cost=np.array([row[3] for row in rows], dtype=float),
+        lots=np.array([row[4] for row in rows], dtype=np.int64),
+    )
+
+@profiling.timed()
+@read_cache.cached("lots")
+def get_symbol_totals() -> Dict[str, tuple]:
+    # {symbol: (quantity, cost, lots)} across every account
+    rows = db.get_connection().execute('SELECT symbol, quantity, cost, lots FROM lot_symbols').fetchall()
+    return {symbol: (quantity, cost, lots) for symbol, quantity, cost, lots in rows}
+
+@profiling.timed()
+@read_cache.cached("lots")
+def get_lot_book() -> LotBook:
+    # Every open lot as columns (for holding periods and specific-ID picks)
+    rows = db.get_connection().execute(
+        'SELECT id, account_id, symbol, acquired, quantity, unit_cost FROM lots ORDER BY account_id, symbol, acquired, id'
+    ).fetchall()
+    return LotBook(
+        ids=np.array([row[0] for row in rows], dtype=np.int64),
+        account_ids=np.array([row[1] for row in rows], dtype=np.int64),
+        symbols=[row[2] for row in rows],
+        acquired=np.array([row[3] for row in rows], dtype="datetime64[D]"),
+        quantity=np.array([row[4] for row in rows], dtype=float),
+        unit_cost=np.array([row[5] for row in rows], dtype=float),
+    )
+
+def _price_array(symbols: List[str], prices: Dict[str, float]) -> np.ndarray:
+    # Prices aligned with symbols (NaN where unknown), one lookup per distinct symbol
+    if not symbols:
+        return np.zeros(0)
+    unique, inverse = np.unique(np.array(symbols), return_inverse=True)
+    lookup = np.array([prices.get(symbol, np.nan) for symbol in unique.tolist()], dtype=float)
+    return lookup[inverse]
+
+@profiling.timed()
+def unrealized_gains(prices: Optional[Dict[str, float]] = None) -> UnrealizedGains:
+    """Market value and unrealized gain of every lot position at prices.
+
+    One vectorized join of the position aggregates against the price map
+    (default constants.STOCK_PRICES).
+    """
+    if prices is None:
+        import constants
+        prices = constants.STOCK_PRICES
+    positions = get_positions()
+    price = _price_array(positions.symbols, prices)
+    value = positions.quantity * price
+    return UnrealizedGains(positions, price, value, value - positions.cost)
+
+@profiling.timed()
+def holding_period_gains(prices: Optional[Dict[str, float]] = None,
+                         as_of: Optional[date] = None) -> Dict[str, float]:
+    # Unrealized short- and long-term gain over all lots with a known price
+    if prices is None:
+        import constants
+        prices = constants.STOCK_PRICES
+    book = get_lot_book()
+    gain = book.quantity * (_price_array(book.symbols, prices) - book.unit_cost)
+    long_term = (np.datetime64(as_of or date.today(), "D") - book.acquired).astype(np.int64) > LONG_TERM_DAYS
+    priced = ~np.isnan(gain)
+    return {
+        "short_term": float(gain[priced & ~long_term].sum()),
+        "long_term": float(gain[priced & long_term].sum()),
+    }
+
+@profiling.timed()
+@read_cache.cached("lots")
+def realized_gains(year: Optional[int] = None) -> Dict[str, float]:
+    # Realized short- and long-term gain from disposals (in one calendar year, if given)
+    row = db.get_connection().execute('''
+        SELECT
+            COALESCE(SUM(CASE WHEN julianday(disposed) - julianday(acquired) <= ? THEN quantity * (unit_proceeds - unit_cost) END), 0),
+            COALESCE(SUM(CASE WHEN julianday(disposed) - julianday(acquired) > ? THEN quantity * (unit_proceeds - unit_cost) END), 0)
+        FROM disposals WHERE ? IS NULL OR substr(disposed, 1, 4) = ?
+    ''', (LONG_TERM_DAYS, LONG_TERM_DAYS, year, str(year) if year else None)).fetchone()
+    return {"short_term": row[0], "long_term": row[1]}
+
+@profiling.timed()
+@read_cache.cached("lots", "stocks", "ira_holdings")
+def lot_mismatches() -> List[Tuple[int, str, float, float]]:
+    # (account_id, symbol, lot shares, held shares) wherever the lots hold more
+    # than the account, e.g. in files written before holdings closed their lots
+    return db.get_connection().execute('''
+        SELECT account_id, symbol, quantity, held FROM (
+            SELECT p.account_id, p.symbol, p.quantity, COALESCE(CASE WHEN p.account_id = 0
+                THEN (SELECT shares FROM stocks WHERE symbol = p.symbol)
+                ELSE (SELECT shares FROM ira_holdings WHERE account_id = p.account_id AND symbol = p.symbol)
+            END, 0) AS held
+            FROM lot_positions p
+        ) WHERE quantity > held + 1e-9
+        ORDER BY account_id, symbol
+    ''').fetchall()
@@ -1,45 +1,175 @@
-
-from constants import TREASURIES
-from datetime import datetime
+import constants
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional
+import numpy as np
 import db
+import profiling
+import read_cache
+import store
 
-# Utility to sync in-memory TREASURIES from DB
-def sync_treasuries_from_db():
-    TREASURIES.clear()
-    for name, ttype, face_value, interest_rate, purchase_date, maturity_date in db.get_treasuries_db():
-        TREASURIES[name] = {
-            "type": ttype,
-            "face_value": face_value,
-            "interest_rate": interest_rate,
-            "purchase_date": purchase_date,
-            "maturity_date": maturity_date
-        }
-
+# Treasuries live in the current database's store (store.current().treasuries);
+# the db writes below keep it up to date. Derived views re-read it: valuations
+# are recomputed, and cashflows.py re-expands only the edited bond's schedule.
 def add_treasury(name: str, ttype: str, face_value: float, interest_rate: float, purchase_date: str, maturity_date: str):
     db.add_treasury_db(name, ttype, face_value, interest_rate, purchase_date, maturity_date)
-    sync_treasuries_from_db()
 
 def remove_treasury(name: str):
     db.remove_treasury_db(name)
-    sync_treasuries_from_db()
 
+# ---------------- Vectorized Pricing Engine ----------------
+# Treasury type codes. Each type accrues differently:
+#   Bills: bought at a discount and accrete to face at maturity
+#   Notes/Bonds/FRN: valued at par plus interest accrued since the last coupon
+#   TIPS: like notes, on a principal indexed to TIPS_INFLATION_RATE
+#   Series EE/I: savings bonds compounding semiannually, no coupons
+# Accrual stops at maturity for every type.
+BILL, COUPON, FRN, TIPS, SERIES_EE, SERIES_I, OTHER = range(7)
+
+TYPE_CODES = {
+    "Bills": BILL,
+    "Notes": COUPON,
+    "Bonds": COUPON,
+    "FRN": FRN,
+    "TIPS Notes/Bonds": TIPS,
+    "Series EE Bonds": SERIES_EE,
+    "Series I Bonds": SERIES_I,
+}
+
+class TreasuryBook(NamedTuple):
+    names: List[str]
+    types: np.ndarray       # type codes
+    face: np.ndarray
+    rate: np.ndarray
+    purchase: np.ndarray    # datetime64[D]
+    maturity: np.ndarray    # datetime64[D]
+
+def _parse_dates(values: List[str]) -> np.ndarray:
+    # ISO dates (with or without a time part) parsed in one call
+    return np.array(values, dtype="datetime64[s]").astype("datetime64[D]")
+
+@profiling.timed()
+def build_book(rows) -> TreasuryBook:
+    # Parse rows shaped like db.get_treasuries_db into columnar arrays
+    rows = list(rows)
+    return TreasuryBook(
+        names=[row[0] for row in rows],
+        types=np.array([TYPE_CODES.get(row[1], OTHER) for row in rows], dtype=np.int8),
+        face=np.array([row[2] for row in rows], dtype=float),
+        rate=np.array([row[3] for row in rows], dtype=float),
+        purchase=_parse_dates([row[4] for row in rows]),
+        maturity=_parse_dates([row[5] for row in rows]),
+    )
+
+@profiling.timed()
+def value_book(book: TreasuryBook, as_of: Optional[date] = None,
+               curve: Optional[Dict[float, float]] = None) -> np.ndarray:
+    """Value every lot in the book as of a date, in one vectorized pass.
+
+    With a yield curve ({years to maturity: yield}), marketable securities are
+    marked to market by discounting their remaining cash flows instead.
+    """
+    today = np.datetime64(as_of or date.today(), "D")
+    face, rate, types = book.face, book.rate, book.types
+    end = np.minimum(today, book.maturity)
+    held = np.maximum((end - book.purchase).astype(float), 0.0)
+    term = np.maximum((book.maturity - book.purchase).astype(float), 1.0)
+    remaining = np.maximum((book.maturity - today).astype(float), 0.0)
+
+    # Bills: discount price accreting linearly to face
+    discount_price = face * (1 - rate * term / 360)
+    bill = discount_price + (face - discount_price) * held / term
+
+    # Coupon securities: par plus the fraction of the current coupon period elapsed
+    freq = np.where(types == FRN, 4.0, 2.0)
+    periods_left = remaining / (365.25 / freq)
+    accrued_fraction = np.ceil(periods_left) - periods_left
+    principal = np.where(types == TIPS, face * (1 + constants.TIPS_INFLATION_RATE) ** (held / 365.25), face)
+    coupon_payment = principal * rate / freq
+    coupon = principal + coupon_payment * accrued_fraction
+
+    # Savings bonds compound semiannually; EE bonds are guaranteed to double after 20 years
+    savings = face * (1 + rate / 2) ** (2 * held / 365.25)
+    savings = np.where((types == SERIES_EE) & (held >= 20 * 365.25), np.maximum(savings, 2 * face), savings)
+
+    # Anything else keeps the simple interest approximation
+    simple = face * (1 + rate * held / 365)
+
+    if curve:
+        years = np.array(sorted(curve), dtype=float)
+        yields = np.array([curve[y] for y in sorted(curve)], dtype=float)
+        y = np.interp(remaining / 365.25, years, yields)
+        live = remaining > 0
+        bill = np.where(live, face / (1 + y * remaining / 365), bill)
+        # TIPS are discounted at an approximate real yield
+        period_yield = np.where(types == TIPS, y - constants.TIPS_INFLATION_RATE, y) / freq
+        with np.errstate(divide="ignore", invalid="ignore"):
+            discount = (1 + period_yield) ** -periods_left
+            annuity = np.where(period_yield != 0, (1 - discount) / period_yield, periods_left)
+        clean = coupon_payment * annuity + principal * discount
+        coupon = np.where(live & (types != FRN), clean + coupon_payment * accrued_fraction, coupon)
+
+    values = np.select(
+        [types == BILL, (types == COUPON) | (types == FRN) | (types == TIPS), (types == SERIES_EE) | (types == SERIES_I)],
+        [bill, coupon, savings],
+        default=simple,
+    )
+    return np.round(values, 2)
+
+@profiling.timed()
+def value_rows(rows, as_of: Optional[date] = None) -> Dict[str, float]:
+    # {name: current value} for rows shaped like db.get_treasuries_db
+    book = build_book(rows)
+    values = value_book(book, as_of, get_valuation_curve())
+    return dict(zip(book.names, values.tolist()))
+
+@read_cache.cached("treasuries")
+def get_treasury_book() -> TreasuryBook:
+    # Parsed book for the current database's treasuries, rebuilt when they change
+    return build_book(
+        (name, t["type"], t["face_value"], t["interest_rate"], t["purchase_date"], t["maturity_date"])
+        for name, t in store.current().treasuries.items()
+    )
+
+@profiling.timed()
+@read_cache.cached("treasuries", "quotes", daily=True)
+def current_values() -> Dict[str, float]:
+    # Values of every treasury in the current database, computed once per day
+    # (and again when the treasuries or the cached yield curve change)
+    book = get_treasury_book()
+    values = value_book(book, date.today(), get_valuation_curve())
+    return dict(zip(book.names, values.tolist()))
+
+# ---------------- Yield Curve ----------------
+# Treasury yield indices (quoted in percent) cached in the quote cache,
+# keyed by years to maturity.
+YIELD_CURVE_TICKERS = {
+    0.25: "^IRX",
+    5.0: "^FVX",
+    10.0: "^TNX",
+    30.0: "^TYX",
+}
+
+def get_cached_yield_curve() -> Optional[Dict[float, float]]:
+    # Last cached yield curve as {years: decimal yield}, or None if incomplete
+    import quote_cache
+    quotes = quote_cache.get_quotes()
+    curve = {}
+    for years, ticker in YIELD_CURVE_TICKERS.items():
+        if ticker not in quotes:
+            return None
+        curve[years] = quotes[ticker].price / 100
+    return curve
+
+def get_valuation_curve() -> Optional[Dict[float, float]]:
+    # Curve used for valuations: None unless mark-to-market is turned on
+    if not constants.MARK_TREASURIES_TO_MARKET:
+        return None
+    return get_cached_yield_curve()
+
+# ---------------- Public Interface ----------------
 def calculate_current_value(name: str) -> float:
-    
-    # Calculates the current value of a treasury using simple interest.
-    # For T-bills, you can just return face_value; for notes/bonds, calculate accrued interest.
-    
-    t = TREASURIES[name]
-    face = t["face_value"]
-    rate = t["interest_rate"]
-    purchase = datetime.fromisoformat(t["purchase_date"])
-    today = datetime.today()
-    days_held = (today - purchase).days
-    # Simple interest approximation
-    value = face * (1 + rate * days_held / 365)
-    return round(value, 2)
+    # Current value of one treasury (see value_book for the rules)
+    return current_values()[name]
 
 def calculate_total_treasuries_value():
-    total = 0.0
-    for name in TREASURIES:
-        total += calculate_current_value(name)
-    return total
+    return float(sum(current_values().values()))
@@ -0,0 +1,155 @@
+from typing import Dict, List, NamedTuple, Optional
+import numpy as np
+import constants
+import db
+import profiling
+import read_cache
+
+# Columnar valuation engine. Positions are held as parallel NumPy arrays
+# (symbol id, shares, account id) plus fixed-value rows for balances, so a
+# whole snapshot is valued with a handful of vectorized operations.
+
+# Net worth categories, in the order the Dashboard pie chart shows them
+CATEGORIES = ["Portfolio", "IRA Equities", "Roth 401k", "Traditional 401k", "Other Retirement", "Cash Accounts", "Treasuries"]
+_CATEGORY_INDEX = {name: i for i, name in enumerate(CATEGORIES)}
+
+class Account(NamedTuple):
+    key: str        # unique, e.g. "portfolio", "retirement:3", "cash:Checking", "treasury:Bills"
+    label: str
+    category: str
+
+class Positions(NamedTuple):
+    symbols: List[str]              # symbol universe; symbol id = index
+    accounts: List[Account]         # account id = index
+    symbol_ids: np.ndarray          # per priced position
+    shares: np.ndarray              # per priced position
+    account_ids: np.ndarray         # per priced position
+    fixed_values: np.ndarray        # per fixed-value row (cash, 401k balances, treasuries)
+    fixed_account_ids: np.ndarray   # per fixed-value row
+    account_categories: np.ndarray  # category index per account
+
+class Valuation(NamedTuple):
+    net_worth: float
+    by_account: Dict[str, float]    # account key -> value
+    by_category: Dict[str, float]   # category -> value
+    by_symbol: Dict[str, float]     # symbol -> value across all accounts
+    position_values: np.ndarray     # value of each priced position, aligned with Positions rows
+
+def _retirement_category(acc_type: str) -> str:
+    if "IRA" in acc_type:
+        return "IRA Equities"
+    if acc_type == "401k_roth":
+        return "Roth 401k"
+    if acc_type == "401k_traditional":
+        return "Traditional 401k"
+    return "Other Retirement"
+
+@profiling.timed()
+def build_positions(snapshot, treasury_values: Optional[Dict[str, float]] = None) -> Positions:
+    """Lay out a db.PortfolioSnapshot as columnar positions.
+
+    treasury_values maps treasury name to its current value; when omitted it
+    is treasury.current_values(), the cached values of the current database's
+    treasuries (the database the snapshot was read from).
+    """
+    symbols: List[str] = []
+    symbol_index: Dict[str, int] = {}
+    accounts: List[Account] = []
+    account_index: Dict[str, int] = {}
+    symbol_ids: List[int] = []
+    shares: List[float] = []
+    account_ids: List[int] = []
+    fixed_values: List[float] = []
+    fixed_account_ids: List[int] = []
+
+    def account_id(key: str, label: str, category: str) -> int:
+        if key not in account_index:
+            account_index[key] = len(accounts)
+            accounts.append(Account(key, label, category))
+        return account_index[key]
+
+    def add_position(symbol: str, qty: float, acc: int):
+        symbol = symbol.upper()
+        if symbol not in symbol_index:
+            symbol_index[symbol] = len(symbols)
+            symbols.append(symbol)
+        symbol_ids.append(symbol_index[symbol])
+        shares.append(qty)
+        account_ids.append(acc)
+
+    portfolio = account_id("portfolio", "Portfolio", "Portfolio")
+    for symbol, qty in snapshot.stocks.items():
+        add_position(symbol, qty, portfolio)
+
+    for acc_id, name, acc_type, balance in snapshot.retirement_accounts:
+        acc = account_id(f"retirement:{acc_id}", name, _retirement_category(acc_type))
+        if "IRA" in acc_type:
+            for _, symbol, qty in snapshot.ira_holdings.get(acc_id, ()):
+                add_position(symbol, qty, acc)
+        else:
+            fixed_values.append(balance or 0.0)
+            fixed_account_ids.append(acc)
+
+    for name, balance in snapshot.cash.items():
+        fixed_values.append(balance)
+        fixed_account_ids.append(account_id(f"cash:{name}", name, "Cash Accounts"))
+
+    if treasury_values is None:
+        from treasury import current_values
+        treasury_values = current_values()
+    for name, ttype, *_ in snapshot.treasuries:
+        fixed_values.append(treasury_values.get(name, 0.0))
+        fixed_account_ids.append(account_id(f"treasury:{ttype}", ttype, "Treasuries"))
+
+    return Positions(
+        symbols=symbols,
+        accounts=accounts,
+        symbol_ids=np.asarray(symbol_ids, dtype=np.intp),
+        shares=np.asarray(shares, dtype=float),
+        account_ids=np.asarray(account_ids, dtype=np.intp),
+        fixed_values=np.asarray(fixed_values, dtype=float),
+        fixed_account_ids=np.asarray(fixed_account_ids, dtype=np.intp),
+        account_categories=np.asarray([_CATEGORY_INDEX[a.category] for a in accounts], dtype=np.intp),
+    )
+
+@profiling.timed()
+def price_vector(positions: Positions, prices: Optional[Dict[str, float]] = None) -> np.ndarray:
+    # Prices aligned with positions.symbols; unknown symbols are priced at 0
+    prices = constants.STOCK_PRICES if prices is None else prices
+    return np.fromiter((prices.get(symbol, 0.0) for symbol in positions.symbols), dtype=float, count=len(positions.symbols))
+
+@profiling.timed()
+def value_positions(positions: Positions, prices: np.ndarray) -> Valuation:
+    # Value every position and roll up per account, category and symbol in one pass
+    n_accounts = len(positions.accounts)
+    position_values = positions.shares * prices[positions.symbol_ids]
+    by_account = (np.bincount(positions.account_ids, position_values, minlength=n_accounts)
+                  + np.bincount(positions.fixed_account_ids, positions.fixed_values, minlength=n_accounts))
+    by_category = np.bincount(positions.account_categories, by_account, minlength=len(CATEGORIES))
+    by_symbol = np.bincount(positions.symbol_ids, position_values, minlength=len(positions.symbols))
+    return Valuation(
+        net_worth=float(by_category.sum()),
+        by_account={a.key: float(v) for a, v in zip(positions.accounts, by_account)},
+        by_category={name: float(v) for name, v in zip(CATEGORIES, by_category)},
+        by_symbol={symbol: float(v) for symbol, v in zip(positions.symbols, by_symbol)},
+        position_values=position_values,
+    )
+
+def iter_position_values(positions: Positions, valuation: Valuation):
+    # Yield (account, symbol, shares, value) for each priced position
+    rows = zip(positions.account_ids.tolist(), positions.symbol_ids.tolist(), positions.shares.tolist(), valuation.position_values.tolist())
+    for acc, symbol_id, qty, value in rows:
+        yield positions.accounts[acc], positions.symbols[symbol_id], qty, value
+
+def value_snapshot(snapshot, prices: Optional[Dict[str, float]] = None) -> Valuation:
+    positions = build_positions(snapshot)
+    return value_positions(positions, price_vector(positions, prices))
+
+@profiling.timed()
+@read_cache.cached(*db.PORTFOLIO_TABLES, "prices", daily=True)
+def current_valuation():
+    # (snapshot, positions, valuation) for the current DB and STOCK_PRICES,
+    # recomputed only after a write, a price update or a new day
+    snapshot = db.get_portfolio_snapshot()
+    positions = build_positions(snapshot)
+    return snapshot, positions, value_positions(positions, price_vector(positions))